@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Colorization of animated sprites, APNG or GIF, used by
+sgbpal.colorize_all() and sgbpal.colorize_all_data().
+
+The 4-color analysis runs once over every frame: the sorted
+palette comes from the RGB555 colors of the whole animation,
+and every frame is indexed through the same lookup table.
+Frames are decoded one at a time, twice: once for the color
+set and once to be indexed and encoded.
+
+APNG sprites keep their frame control chunks: the image of
+each IDAT or fdAT stream is decoded as a standalone PNG, and
+re-encoded with the encode profile and bit depth of still
+sprites, so that peak memory only depends on the size of a
+frame. Palette variants are copied from the first output with
+their PLTE chunk replaced. GIF sprites are read and written
+through Pillow, which holds the frames of an output in memory.
+"""
+
+import contextlib
+import io
+import struct
+
+import numpy as np
+import png
+
+import sgbpal
+from colors import atomic_open, key_rgb5, sort_palette, output_palette
+from profiling import stage
+
+APNG_CHUNKS = sgbpal.IMAGE_CHUNKS + (b"acTL", b"fcTL", b"fdAT")
+
+def apng_images(file):
+    """
+    Header chunks of an APNG file up to its first image, and an
+    iterator over its images as (fcTL data or None, zlib stream),
+    read one at a time. The first image is the one of the IDAT
+    chunks, without fcTL when it is not part of the animation.
+    """
+    chunks = png.Reader(file).chunks()
+    header = {}
+    for tag, data in chunks:
+        if tag in (b"fcTL", b"IDAT"):
+            break
+        header[tag] = data
+
+    def images(tag, data):
+        fctl, stream = None, []
+        while tag != b"IEND":
+            if tag == b"fcTL":
+                if stream:
+                    yield fctl, b"".join(stream)
+                    stream = []
+                fctl = data
+            elif tag == b"IDAT":
+                stream.append(data)
+            elif tag == b"fdAT":
+                # sequence number
+                stream.append(data[4:])
+            tag, data = next(chunks)
+        if stream:
+            yield fctl, b"".join(stream)
+
+    return header, images(tag, data)
+
+def image_pixels(header, fctl, stream):
+    """(height, width, 4) RGBA8 pixels of an image of an APNG file."""
+    ihdr = header[b"IHDR"]
+    if fctl is not None:
+        # frame width and height
+        ihdr = fctl[4:12] + ihdr[8:]
+    chunks = [(b"IHDR", ihdr)]
+    chunks += [(tag, header[tag]) for tag in (b"PLTE", b"tRNS") if tag in header]
+    chunks += [(b"IDAT", stream), (b"IEND", b"")]
+    return sgbpal.read_rgba8(io.BytesIO(sgbpal.write_chunks(chunks)))
+
+def apng_frames(file):
+    header, images = apng_images(file)
+    for fctl, stream in images:
+        with stage("decode"):
+            yield image_pixels(header, fctl, stream)
+
+def gif_frames(file):
+    from PIL import Image, ImageSequence
+    with Image.open(file) as img:
+        for frame in ImageSequence.Iterator(img):
+            with stage("decode"):
+                yield np.asarray(frame.convert("RGBA"))
+
+def frames(file, kind):
+    """RGBA8 frames of an animated sprite of kind apng or gif, one at a time."""
+    return apng_frames(file) if kind == "apng" else gif_frames(file)
+
+def color_set(file, kind):
+    """
+    Distinct RGB555 colors of the frames of an animated sprite, or
+    None as soon as there are more colors than a palette can hold.
+    """
+    present = np.zeros(32768, dtype=bool)
+    for pixels in frames(file, kind):
+        with stage("quantize"):
+            present[sgbpal.rgb5_keys(pixels)] = True
+        if np.count_nonzero(present) > 4:
+            return None
+    return {key_rgb5(int(k)) for k in np.flatnonzero(present)}
+
+def analyze(file, kind):
+    """
+    Sorted palette of the frames of an animated sprite and its
+    set of RGB555 colors, or None if it has too many colors.
+    """
+    colors = color_set(file, kind)
+    if colors is None:
+        return None
+    palette = sort_palette(colors)
+    return None if palette is None else (palette, colors)
+
+def palette_lut(palette, colors, bitdepth):
+    """
+    Bit depth, indices of the written palette entries and lookup
+    table of RGB555 keys to written indices, as colorize_stream().
+    """
+    used = (0, 1, 2, 3)
+    if bitdepth is None:
+        bitdepth = 8
+    elif bitdepth == 1:
+        used = tuple(i for i, c in enumerate(palette) if c in colors)
+        if len(used) > 2:
+            bitdepth = 2
+            used = (0, 1, 2, 3)
+    lut = np.zeros(4, dtype=np.uint8)
+    lut[list(used)] = range(len(used))
+    return bitdepth, used, lut[sgbpal.index_lut(palette)]
+
+def write_apng(src, dst, analysis, colors8, profile="default", bitdepth=None):
+    """
+    Write an APNG sprite colorized with the RGB888 palette colors8
+    of its analysis, one frame at a time. Frame control chunks are
+    kept, renumbered with the fdAT chunks.
+    """
+    palette, colors = analysis
+    bitdepth, used, lut = palette_lut(palette, colors, bitdepth)
+    plte = [colors8[i] for i in used]
+    header, images = apng_images(src)
+    # indexed, not interlaced
+    ihdr = header[b"IHDR"][:8] + bytes((bitdepth, 3, 0, 0, 0))
+    png.write_chunks(dst, [(b"IHDR", ihdr), (b"acTL", header[b"acTL"]), (b"PLTE", sgbpal.plte_bytes(plte))])
+    sequence = 0
+    for i, (fctl, stream) in enumerate(images):
+        if fctl is not None:
+            png.write_chunk(dst, b"fcTL", struct.pack(">I", sequence) + fctl[4:])
+            sequence += 1
+        with stage("decode"):
+            pixels = image_pixels(header, fctl, stream)
+        with stage("index"):
+            indices = lut[sgbpal.rgb5_keys(pixels)]
+        with stage("encode"):
+            out = io.BytesIO()
+            sgbpal.write_indexed(out, indices, plte, profile, bitdepth)
+        for tag, data in sgbpal.read_chunks(out.getvalue()):
+            if tag != b"IDAT":
+                continue
+            if i == 0:
+                png.write_chunk(dst, b"IDAT", data)
+            else:
+                png.write_chunk(dst, b"fdAT", struct.pack(">I", sequence) + data)
+                sequence += 1
+    png.write_chunk(dst, b"IEND")
+
+def write_gif(src, dst, analysis, colors8):
+    """Write a GIF sprite colorized with the RGB888 palette colors8 of its analysis."""
+    from PIL import Image, ImageSequence
+    palette, _ = analysis
+    lut = sgbpal.index_lut(palette)
+    plte = sgbpal.plte_bytes(colors8)
+    with Image.open(src) as img:
+        loop = img.info.get("loop")
+
+        def indexed():
+            for frame in ImageSequence.Iterator(img):
+                duration = frame.info.get("duration", 0)
+                with stage("index"):
+                    out = Image.fromarray(lut[sgbpal.rgb5_keys(np.asarray(frame.convert("RGBA")))], "P")
+                out.putpalette(plte)
+                out.info["duration"] = duration
+                yield out
+
+        first, *rest = indexed()
+        options = {} if loop is None else {"loop": loop}
+        with stage("encode"):
+            first.save(dst, "GIF", save_all=True, append_images=rest, optimize=False, **options)
+
+def encode(src, dst, kind, analysis, colors8, profile="default", bitdepth=None):
+    src.seek(0)
+    if kind == "apng":
+        write_apng(src, dst, analysis, colors8, profile, bitdepth)
+    else:
+        write_gif(src, dst, analysis, colors8)
+
+def encode_variant(src, first, dst, kind, analysis, colors8, profile="default", bitdepth=None):
+    """
+    Write a palette variant of an animated sprite, copied from its
+    first output for APNG sprites, encoded again for GIF ones.
+    """
+    if kind == "gif":
+        encode(src, dst, kind, analysis, colors8)
+        return
+    used = palette_lut(*analysis, bitdepth)[1]
+    first.seek(0)
+    sgbpal.copy_with_palette(first, dst, [colors8[i] for i in used], APNG_CHUNKS)
+
+def check_outputs(kind, outputs):
+    extension = ".gif" if kind == "gif" else ".png"
+    if not all(output is None or output.lower().endswith(extension) for output in outputs):
+        raise ValueError(f"animated {kind.upper()} sprites can only be written as {extension}")
+
+def colorize_all(file, kind, outputs, profile="default", bitdepth=None):
+    """
+    Colorize an animated sprite, given as a binary file, once for
+    every output filename -> 4-color RGB555 palette of outputs.
+    Outputs are written through atomic_open(), and renamed together
+    once all of them are written. Return False if the sprite has
+    too many colors.
+    """
+    check_outputs(kind, outputs)
+    analysis = analyze(file, kind)
+    if analysis is None:
+        return False
+    (first, colors), *others = outputs.items()
+    # the outputs are renamed once all of them are written
+    with contextlib.ExitStack() as stack:
+        out = stack.enter_context(atomic_open(first))
+        with stage("write"):
+            encode(file, out, kind, analysis, output_palette(analysis[0], colors), profile, bitdepth)
+        out.flush()
+        first_file = stack.enter_context(open(out.name, "rb"))
+        for output, colors in others:
+            out = stack.enter_context(atomic_open(output))
+            with stage("write"):
+                encode_variant(file, first_file, out, kind, analysis, output_palette(analysis[0], colors),
+                               profile, bitdepth)
+    return True
+
+def colorize_all_data(data, kind, outputs, profile="default", bitdepth=None):
+    """colorize_all() in memory: output filename -> bytes, or None if the sprite has too many colors."""
+    check_outputs(kind, outputs)
+    file = io.BytesIO(data)
+    analysis = analyze(file, kind)
+    if analysis is None:
+        return None
+    (first, colors), *others = outputs.items()
+    first_file = io.BytesIO()
+    encode(file, first_file, kind, analysis, output_palette(analysis[0], colors), profile, bitdepth)
+    results = {first: first_file.getvalue()}
+    for output, colors in others:
+        out = io.BytesIO()
+        encode_variant(file, first_file, out, kind, analysis, output_palette(analysis[0], colors), profile, bitdepth)
+        results[output] = out.getvalue()
+    return results
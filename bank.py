@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Usage: python bank.py list bank.bin
+       python bank.py get bank.bin sprite game mode palette_name out.png
+
+Sprite bank: every palette variant of many sprites in one
+append-only file, written by batch.py --bank instead of one
+PNG per variant. Each sprite is stored once, as the IHDR and
+IDAT chunks of its 2-bit indexed PNG, and each palette once per
+writing session, as a PLTE chunk; a variant (sprite, game,
+mode, palette name) only points at both. The PNG of a variant
+is its IHDR, PLTE and IDAT chunks, as stored, between the PNG
+signature and an IEND chunk.
+
+Variants are looked up through an open addressing hash table of
+fixed size at the start of the file, which is mapped with mmap:
+a lookup only reads the slots it probes and one entry, and the
+chunks are returned as memoryviews of the map, without copies.
+Adding a variant again points its slot at the new entry, the old
+one stays in the file unused.
+"""
+
+import hashlib
+import io
+import mmap
+import os
+import struct
+import sys
+
+import numpy as np
+import png
+
+MAGIC = b"SGBBANK\1"
+# magic, slot count, variant count
+HEADER = struct.Struct("<8sQQ")
+# key hash, entry offset (0 if empty)
+SLOT = struct.Struct("<QQ")
+# sprite offset, palette offset, key length
+ENTRY = struct.Struct("<QQH")
+# chunks length
+SPRITE = struct.Struct("<I")
+# IHDR, PLTE and IDAT chunks of 4 colors have fixed sizes
+IHDR_SIZE = 25
+PLTE_SIZE = 24
+IEND = b"\0\0\0\0IEND\xaeB`\x82"
+
+DEFAULT_SLOTS = 1 << 18
+
+def chunk_bytes(tag, data):
+    """Bytes of a PNG chunk: length, tag, data and CRC."""
+    out = io.BytesIO()
+    png.write_chunk(out, tag, data)
+    return out.getvalue()
+
+def variant_key(sprite, game, mode, name):
+    return "\0".join((sprite, game, mode or "", name)).encode()
+
+def key_hash(key):
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little")
+
+def sprite_name(filename):
+    """Name of the sprite of a file in a bank: its path without extension, with / separators."""
+    return os.path.splitext(filename)[0].replace(os.sep, "/")
+
+class Bank:
+    """
+    Read-only sprite bank, mapped with mmap. The memoryviews it
+    returns must be released before closing it.
+    """
+    def __init__(self, filename):
+        with open(filename, "rb") as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+        magic, self.slot_count, self.count = HEADER.unpack_from(self.map)
+        if magic != MAGIC:
+            raise ValueError(f"{filename} is not a sprite bank")
+
+    def close(self):
+        self.view.release()
+        self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def entry(self, offset):
+        """Key, sprite offset and palette offset of the entry at offset."""
+        sprite, palette, length = ENTRY.unpack_from(self.map, offset)
+        start = offset + ENTRY.size
+        return self.map[start:start + length], sprite, palette
+
+    def find(self, sprite, game, mode, name):
+        """Sprite and palette offsets of a variant, or None."""
+        key = variant_key(sprite, game, mode, name)
+        h = key_hash(key)
+        mask = self.slot_count - 1
+        slot = h & mask
+        while True:
+            slot_hash, offset = SLOT.unpack_from(self.map, HEADER.size + slot * SLOT.size)
+            if offset == 0:
+                return None
+            if slot_hash == h:
+                entry_key, sprite_offset, palette_offset = self.entry(offset)
+                if entry_key == key:
+                    return sprite_offset, palette_offset
+            slot = (slot + 1) & mask
+
+    def chunks(self, sprite, game, mode, name):
+        """IHDR, PLTE and IDAT chunks of a variant as memoryviews, or None."""
+        found = self.find(sprite, game, mode, name)
+        if found is None:
+            return None
+        sprite_offset, palette_offset = found
+        length = SPRITE.unpack_from(self.map, sprite_offset)[0]
+        start = sprite_offset + SPRITE.size
+        return (self.view[start:start + IHDR_SIZE],
+                self.view[palette_offset:palette_offset + PLTE_SIZE],
+                self.view[start + IHDR_SIZE:start + length])
+
+    def png_parts(self, sprite, game, mode, name):
+        """
+        The PNG of a variant as a list of buffers, for writelines()
+        or socket.sendmsg(), or None.
+        """
+        chunks = self.chunks(sprite, game, mode, name)
+        return None if chunks is None else [png.signature, *chunks, IEND]
+
+    def png(self, sprite, game, mode, name):
+        """PNG bytes of a variant, or None."""
+        parts = self.png_parts(sprite, game, mode, name)
+        return None if parts is None else b"".join(parts)
+
+    def indexed(self, sprite, game, mode, name):
+        """
+        (height, width) palette indices of a variant and its RGB888
+        palette as a 12-byte memoryview, or None.
+        """
+        parts = self.png_parts(sprite, game, mode, name)
+        if parts is None:
+            return None
+        width, height, rows, _ = png.Reader(bytes=b"".join(parts)).read()
+        indices = np.vstack([np.frombuffer(bytes(row), dtype=np.uint8) for row in rows])
+        # PLTE chunk data, without length, tag and CRC
+        return indices.reshape(height, width), parts[2][8:-4]
+
+    def items(self):
+        """(sprite, game, mode, name) of every variant, in slot order."""
+        for slot in range(self.slot_count):
+            offset = SLOT.unpack_from(self.map, HEADER.size + slot * SLOT.size)[1]
+            if offset:
+                sprite, game, mode, name = self.entry(offset)[0].decode().split("\0")
+                yield sprite, game, mode or None, name
+
+class BankWriter:
+    """
+    Appends sprites, palettes and variants to a sprite bank,
+    created with slot_count slots (a power of 2) if it doesn't
+    exist. The index is updated in place once an entry is written,
+    and the variant count when closing.
+    """
+    def __init__(self, filename, slot_count=DEFAULT_SLOTS):
+        if not os.path.exists(filename):
+            if slot_count & (slot_count - 1):
+                raise ValueError("the slot count of a bank must be a power of 2")
+            with open(filename, "wb") as file:
+                file.write(HEADER.pack(MAGIC, slot_count, 0))
+                file.truncate(HEADER.size + slot_count * SLOT.size)
+        self.file = open(filename, "r+b")
+        magic, self.slot_count, self.count = HEADER.unpack(self.file.read(HEADER.size))
+        if magic != MAGIC:
+            self.file.close()
+            raise ValueError(f"{filename} is not a sprite bank")
+        self.palettes = {}
+
+    def close(self):
+        self.file.seek(0)
+        self.file.write(HEADER.pack(MAGIC, self.slot_count, self.count))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def append(self, data):
+        offset = self.file.seek(0, os.SEEK_END)
+        self.file.write(data)
+        return offset
+
+    def add_sprite(self, ihdr, idat):
+        """Offset of a sprite of IHDR and IDAT chunk bytes."""
+        return self.append(SPRITE.pack(len(ihdr) + len(idat)) + ihdr + idat)
+
+    def add_palette(self, plte):
+        """Offset of a palette of PLTE chunk bytes, shared by the variants of a session."""
+        if plte not in self.palettes:
+            self.palettes[plte] = self.append(plte)
+        return self.palettes[plte]
+
+    def add(self, sprite, game, mode, name, sprite_offset, palette_offset):
+        key = variant_key(sprite, game, mode, name)
+        h = key_hash(key)
+        mask = self.slot_count - 1
+        slot = h & mask
+        while True:
+            self.file.seek(HEADER.size + slot * SLOT.size)
+            slot_hash, offset = SLOT.unpack(self.file.read(SLOT.size))
+            if offset == 0:
+                if 4 * (self.count + 1) > 3 * self.slot_count:
+                    raise ValueError("the bank index is full, build a bank with more slots")
+                self.count += 1
+                break
+            if slot_hash == h:
+                self.file.seek(offset)
+                length = ENTRY.unpack(self.file.read(ENTRY.size))[2]
+                if self.file.read(length) == key:
+                    # replaced
+                    break
+            slot = (slot + 1) & mask
+        entry = self.append(ENTRY.pack(sprite_offset, palette_offset, len(key)) + key)
+        self.file.seek(HEADER.size + slot * SLOT.size)
+        self.file.write(SLOT.pack(h, entry))
+
+    def add_variants(self, sprite, ihdr, idat, variants):
+        """Add a sprite with its (game, mode, name) -> PLTE chunk variants."""
+        sprite_offset = self.add_sprite(ihdr, idat)
+        for (game, mode, name), plte in variants.items():
+            self.add(sprite, game, mode, name, sprite_offset, self.add_palette(plte))
+
+def write_png(bank, key, output):
+    """Write the PNG of a variant to output, return False if it is not in the bank."""
+    parts = bank.png_parts(*key)
+    if parts is None:
+        return False
+    with open(output, "wb") as file:
+        file.writelines(parts)
+    return True
+
+def main():
+    usage = "Usage: python bank.py list bank.bin\n       python bank.py get bank.bin sprite game mode palette_name out.png"
+    if len(sys.argv) == 3 and sys.argv[1] == "list":
+        with Bank(sys.argv[2]) as bank:
+            for sprite, game, mode, name in bank.items():
+                print(f"{sprite} {game} {mode or '-'} {name}")
+    elif len(sys.argv) == 8 and sys.argv[1] == "get":
+        sprite, game, mode, name, output = sys.argv[3:]
+        with Bank(sys.argv[2]) as bank:
+            found = write_png(bank, (sprite, game, None if mode == "-" else mode, name), output)
+        if not found:
+            print(f"{sprite} {game} {mode} {name} is not in {sys.argv[2]}!", file=sys.stderr)
+            sys.exit(1)
+    else:
+        print(usage, file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
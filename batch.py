@@ -0,0 +1,483 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Usage: python batch.py [-j jobs] [-r] [-m manifest] [-e profile] [-b bitdepth] [-s] [-t format] [-p] tool (mode) (palette_name) path...
+
+Run one of the tools over many sprites with a process pool.
+The paths may be PNG, GIF or .2bpp files or directories, whose
+PNG, GIF and .2bpp files, in any case, are globbed (recursively with -r). The errors of every file are
+collected into a summary printed at the end.
+
+Tools: g, rb (palette_name), y, gs97 (mode palette_name),
+g2rb, rb2g. With auto as palette_name, the palette of each
+sprite is the one of its species (see registry.py), read from
+its filename.
+
+With --cache, the outputs are fetched from a cache.Cache when
+the input, the palettes and the options are unchanged.
+
+With -p, reads, work and writes overlap: files are read ahead
+and their outputs written in the background, through bounded
+queues, and at most --in-flight files are processed at once.
+It only writes PNGs, as -t png.
+
+With --bank, the colorized variants are written to a sprite bank
+(see bank.py) instead of PNG files, as 2-bit sprites.
+
+With -t 2bpp, the colorizers write .2bpp tile data and .pal
+palettes instead of PNGs (-w and -Z lay out .2bpp inputs and
+outputs as in gbgfx.py).
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import contextlib
+import importlib
+import io
+import os
+import sys
+
+import bank
+import cache as cache_module
+import gbgfx
+import profiling
+import registry
+import sgbpal
+
+EXTENSIONS = (".png", ".gif", ".2bpp")
+
+def find_pngs(paths, recursive=False):
+    """
+    Files of paths, with the PNG, GIF and .2bpp files of directories
+    (in any case, but for hidden ones, as glob) in place of them.
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            found = []
+            for root, dirs, files in os.walk(path, followlinks=True):
+                found += (os.path.join(root, name) for name in files
+                          if not name.startswith(".") and name.lower().endswith(EXTENSIONS))
+                if not recursive:
+                    break
+                dirs[:] = [name for name in dirs if not name.startswith(".")]
+            yield from sorted(found)
+        else:
+            yield path
+
+def read_manifest(filename):
+    with open(filename, encoding="utf-8") as file:
+        for line in file:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                yield line
+
+def tool_module(tool):
+    return importlib.import_module(tool if tool in ("g2rb", "rb2g") else f"sgbpal_{tool}")
+
+def tool_outputs(tool, args, filename, to=None):
+    """
+    Output filename -> colors written by a tool for a file,
+    with the extension of the to format if given.
+    """
+    module = tool_module(tool)
+    if tool in ("g2rb", "rb2g"):
+        return {filename: module.COLORS}
+    if args[-1] == "auto":
+        name = registry.species_palette(filename)
+        if name is None:
+            raise ValueError("is not a known species!")
+        args = args[:-1] + (name,)
+    if tool in ("g", "rb"):
+        outputs = module.outputs(filename, args[0], module.palettes)
+    elif tool == "y":
+        outputs = module.outputs(filename, args[1], module.palettes_sgb, module.palettes_gbc, args[0])
+    else:
+        outputs = module.outputs(filename, args[1], module.palettes, module.palettes_shiny, args[0])
+    if to is not None:
+        outputs = {os.path.splitext(output)[0] + "." + to: colors for output, colors in outputs.items()}
+    return outputs
+
+def tool_variants(tool, args, filename):
+    """(game, mode, palette name) -> colors written by a colorizer for a file."""
+    module = tool_module(tool)
+    *mode, name = args
+    mode = mode[0] if mode else None
+    if name == "auto":
+        name = registry.species_palette(filename)
+        if name is None:
+            raise ValueError("is not a known species!")
+    tables = {table_mode: getattr(module, table)
+              for (game, table_mode), (_, table) in registry.TABLES.items() if game == tool}
+    modes = tables if mode == "all" else [mode]
+    names = next(iter(tables.values())) if name == "all" else [name]
+    return {(tool, m, n): tables[m][n] for m in modes for n in names}
+
+def check_filename(tool, filename):
+    """Return an error message if a tool can't process a file, or None."""
+    if tool in ("g2rb", "rb2g"):
+        if not filename.lower().endswith('.png'):
+            return "is not a .png file!"
+    elif not filename.lower().endswith(('.png', '.gif', '.2bpp')):
+        return "is not a .png, .gif or .2bpp file!"
+    return None
+
+def process(tool, args, filename, options={}):
+    """
+    Run a tool on a file, with the colorize options of
+    sgbpal.colorize_all(), the to output format and whether
+    to stream PNG sprites with sgbpal.colorize_stream().
+    Return an error message, or None.
+    """
+    error = check_filename(tool, filename)
+    if error:
+        return error
+    options = dict(options)
+    to = options.pop("to", None)
+    stream = options.pop("stream", False)
+    if tool == "g2rb":
+        ok = tool_module(tool).g2rb(filename, options.get("profile", "default"))
+    elif tool == "rb2g":
+        ok = tool_module(tool).rb2g(filename, options.get("profile", "default"))
+    else:
+        outputs = tool_outputs(tool, args, filename, to)
+        if stream and not sgbpal.is_2bpp(filename) and not any(map(sgbpal.is_2bpp, outputs)):
+            ok = sgbpal.colorize_stream(filename, outputs, options["profile"], options["bitdepth"])
+        else:
+            ok = sgbpal.colorize_all(filename, outputs, **options)
+    if not ok:
+        return "error!" if tool in ("g2rb", "rb2g") else "has too many colors!"
+    return None
+
+def cached_process(cache, tool, args, filename, options={}):
+    """
+    Run a tool on a file through a cache. Return an error message
+    or None, and the number of bytes fetched from the cache or None.
+    """
+    error = check_filename(tool, filename)
+    if error:
+        return error, None
+    root = os.path.splitext(filename)[0]
+    outputs = tool_outputs(tool, args, filename, options.get("to"))
+    for output in list(outputs):
+        if sgbpal.is_2bpp(output):
+            outputs[gbgfx.pal_filename(output)] = outputs[output]
+    # streaming doesn't change the outputs
+    key_options = sorted((name, value) for name, value in options.items() if name != "stream")
+
+    def output_keys(digest):
+        return {output: cache.key(digest, tool, args, output[len(root):], colors, key_options)
+                for output, colors in outputs.items()}
+
+    keys = output_keys(cache_module.file_digest(filename))
+    if cache.fetch(keys):
+        return None, sum(os.path.getsize(output) for output in keys)
+    error = process(tool, args, filename, options)
+    if error is None:
+        cache.store(keys)
+        if filename in outputs:
+            # written in place: the next run reads the output, a hit as well
+            cache.store(output_keys(cache_module.file_digest(filename)))
+    return error, None
+
+def process_data(tool, args, filename, data, options={}):
+    """
+    Run a tool on the bytes of a file in memory. Return output
+    filename -> PNG bytes, or None and an error message.
+    """
+    error = check_filename(tool, filename)
+    if error:
+        return None, error
+    if tool in ("g2rb", "rb2g"):
+        import whiteswap
+        return {filename: whiteswap.swap_white_data(data, *tool_module(tool).COLORS, options.get("profile", "default"))}, None
+    indexed = None
+    if sgbpal.is_2bpp(filename):
+        indexed = gbgfx.decode_2bpp(data, options.get("width"), options.get("columns")), sgbpal.GRAYSCALE
+        data = None
+    outputs = sgbpal.colorize_all_data(data, tool_outputs(tool, args, filename, "png" if indexed else None),
+                                       options.get("profile", "default"), options.get("bitdepth"), indexed)
+    if outputs is None:
+        return None, "has too many colors!"
+    return outputs, None
+
+def read_file(filename):
+    with open(filename, "rb") as file:
+        return file.read()
+
+def write_outputs(outputs):
+    for output, data in outputs.items():
+        sgbpal.atomic_write(output, data)
+
+async def run_pipelined(tool, args, filenames, jobs=None, in_flight=None, prefetch=16, io_tasks=4, options={}):
+    """
+    Run a tool over files with reads, work and writes overlapped:
+    io_tasks tasks read files ahead into a queue of prefetch files,
+    in_flight tasks (2 per process by default) send them to a pool
+    of jobs processes, and io_tasks tasks write their outputs from
+    a queue of prefetch files, through renamed temporary files.
+    Full queues hold back the stages before them. Return the errors.
+    """
+    loop = asyncio.get_running_loop()
+    executor = concurrent.futures.ProcessPoolExecutor(jobs)
+    if in_flight is None:
+        in_flight = 2 * (jobs or os.cpu_count() or 1)
+    pending = iter(filenames)
+    read_queue = asyncio.Queue(prefetch)
+    write_queue = asyncio.Queue(prefetch)
+    errors = {}
+
+    async def read():
+        for filename in pending:
+            try:
+                data = await asyncio.to_thread(read_file, filename)
+            except OSError as e:
+                errors[filename] = e.strerror or str(e)
+                continue
+            await read_queue.put((filename, data))
+
+    async def work():
+        while (item := await read_queue.get()) is not None:
+            filename, data = item
+            try:
+                outputs, error = await loop.run_in_executor(executor, process_data, tool, args, filename, data, options)
+            except Exception as e:
+                outputs, error = None, str(e) or type(e).__name__
+            if error:
+                errors[filename] = error
+            else:
+                await write_queue.put((filename, outputs))
+
+    async def write():
+        while (item := await write_queue.get()) is not None:
+            filename, outputs = item
+            try:
+                await asyncio.to_thread(write_outputs, outputs)
+            except OSError as e:
+                errors[filename] = e.strerror or str(e)
+
+    with executor:
+        writers = [asyncio.create_task(write()) for _ in range(io_tasks)]
+        workers = [asyncio.create_task(work()) for _ in range(in_flight)]
+        await asyncio.gather(*(read() for _ in range(io_tasks)))
+        for _ in workers:
+            await read_queue.put(None)
+        await asyncio.gather(*workers)
+        for _ in writers:
+            await write_queue.put(None)
+        await asyncio.gather(*writers)
+    return errors
+
+def bank_process(tool, args, filename, options={}):
+    """
+    Encode a sprite for a bank.BankWriter: return its 2-bit IHDR and
+    IDAT chunks and the PLTE chunks of its variants, or None and an
+    error message.
+    """
+    error = check_filename(tool, filename)
+    if error:
+        return None, error
+    indexed = data = None
+    if sgbpal.is_2bpp(filename):
+        indexed = gbgfx.read_2bpp(filename, options.get("width"), options.get("columns")), sgbpal.GRAYSCALE
+    else:
+        with open(filename, "rb") as file:
+            data = file.read()
+        if sgbpal.animation_format(io.BytesIO(data)) is not None:
+            return None, "is animated, and can't be stored in a bank!"
+    encoded = sgbpal.indexed_chunks(data, options.get("profile", "default"), 2, indexed)
+    if encoded is None:
+        return None, "has too many colors!"
+    chunks, palette, used = encoded
+    ihdr = bank.chunk_bytes(b"IHDR", chunks[0][1])
+    idat = b"".join(bank.chunk_bytes(tag, chunk) for tag, chunk in chunks if tag == b"IDAT")
+    variants = {}
+    for key, colors in tool_variants(tool, args, filename).items():
+        colors8 = sgbpal.output_palette(palette, colors)
+        variants[key] = bank.chunk_bytes(b"PLTE", sgbpal.plte_bytes([colors8[i] for i in used]))
+    return (ihdr, idat, variants), None
+
+def run_bank_task(task):
+    tool, args, filename, options = task
+    try:
+        return (filename,) + bank_process(tool, args, filename, options)
+    except Exception as e:
+        return filename, None, str(e) or type(e).__name__
+
+def run_bank(tool, args, filenames, bank_filename, jobs=None, chunksize=16, slot_count=bank.DEFAULT_SLOTS, options={}):
+    """
+    Colorize files into a sprite bank: sprites are encoded by a pool
+    of jobs processes, and written to the bank by this one. Return
+    the errors.
+    """
+    tasks = ((tool, args, filename, options) for filename in filenames)
+    errors = {}
+    with contextlib.ExitStack() as stack:
+        writer = stack.enter_context(bank.BankWriter(bank_filename, slot_count))
+        if jobs == 1:
+            results = map(run_bank_task, tasks)
+        else:
+            executor = stack.enter_context(concurrent.futures.ProcessPoolExecutor(jobs))
+            results = executor.map(run_bank_task, tasks, chunksize=chunksize)
+        for filename, encoded, error in results:
+            if error:
+                errors[filename] = error
+                continue
+            try:
+                writer.add_variants(bank.sprite_name(filename), *encoded)
+            except ValueError as e:
+                errors[filename] = str(e)
+    return errors
+
+def palette_names(tool):
+    if tool == "y":
+        import sgbpal_y
+        return sgbpal_y.palettes_sgb
+    return importlib.import_module(f"sgbpal_{tool}").palettes
+
+def run(task):
+    """Return the filename, error message or None, and cached bytes or None of a task."""
+    tool, args, filename, cache, options = task
+    try:
+        if cache is not None:
+            return (filename,) + cached_process(cache_module.Cache(*cache), tool, args, filename, options)
+        return filename, process(tool, args, filename, options), None
+    except Exception as e:
+        return filename, str(e) or type(e).__name__, None
+
+def run_batch(tool, args, filenames, jobs=None, chunksize=16, cache=None, options={}):
+    """
+    Run a tool over files with a pool of jobs processes, through
+    a cache.Cache if given, whose statistics are updated.
+    Return the errors.
+    """
+    cache_config = None if cache is None else (cache.directory, None, cache.link)
+    tasks = ((tool, args, filename, cache_config, options) for filename in filenames)
+    errors = {}
+    with contextlib.ExitStack() as stack:
+        if jobs == 1:
+            results = map(run, tasks)
+        else:
+            executor = stack.enter_context(concurrent.futures.ProcessPoolExecutor(jobs))
+            results = executor.map(run, tasks, chunksize=chunksize)
+        for filename, error, cached in results:
+            if error:
+                errors[filename] = error
+            elif cache is not None and cached is None:
+                cache.misses += 1
+            elif cache is not None:
+                cache.hits += 1
+                cache.bytes_saved += cached
+    return errors
+
+def print_summary(count, errors, file=sys.stderr):
+    print(f"{count} files processed, {len(errors)} errors", file=file)
+    by_message = {}
+    for filename, error in errors.items():
+        by_message.setdefault(error, []).append(filename)
+    for error, filenames in sorted(by_message.items()):
+        print(f"\n{error} ({len(filenames)})", file=file)
+        for filename in sorted(filenames):
+            print(f"- {filename}", file=file)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run a tool over many sprites with a process pool.")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--chunksize", type=int, default=16, help="files sent to a worker at once")
+    parser.add_argument("-r", "--recursive", action="store_true", help="glob directories recursively")
+    parser.add_argument("-m", "--manifest", action="append", default=[], help="file listing one path per line")
+    parser.add_argument("-e", "--encode", choices=sgbpal.PROFILES, default="default",
+                        help="PNG encode profile of the colorizers and white swaps")
+    parser.add_argument("-b", "--bitdepth", type=int, choices=(8, 2, 1),
+                        help="bit depth of the colorizers' outputs (1 falls back to 2 beyond two colors)")
+    parser.add_argument("-s", "--stream", action="store_true",
+                        help="colorize PNGs one row at a time, for sheets too big to be held in memory")
+    parser.add_argument("-t", "--to", choices=("png", "2bpp"), help="output format of the colorizers")
+    parser.add_argument("-w", "--width", type=int, help="width in pixels of .2bpp sprites (default: square)")
+    parser.add_argument("-Z", "--columns", action="store_true", help=".2bpp tiles in column-major order")
+    parser.add_argument("-p", "--pipeline", action="store_true",
+                        help="overlap reads, work and writes (for slow or network storage)")
+    parser.add_argument("--in-flight", type=int, metavar="N", help="files being processed at once with -p (default: 2 per job)")
+    parser.add_argument("--prefetch", type=int, default=16, metavar="N", help="files read ahead and waiting to be written with -p")
+    parser.add_argument("--io", type=int, default=4, metavar="N", help="concurrent reads and writes with -p")
+    parser.add_argument("--bank", metavar="FILE", help="write the colorized variants to a sprite bank (see bank.py)")
+    parser.add_argument("--bank-slots", type=int, default=bank.DEFAULT_SLOTS, metavar="N",
+                        help="index slots of a new bank, a power of 2 (default: %(default)s)")
+    parser.add_argument("--cache", metavar="DIR", help="cache the outputs in this directory")
+    parser.add_argument("--cache-size", type=int, metavar="MB", help="evict the least recently used outputs beyond this size")
+    parser.add_argument("--cache-link", action="store_true",
+                        help="hard-link cached outputs instead of copying them (they must not be modified in place)")
+    tools = parser.add_subparsers(dest="tool", required=True)
+    for name in ("g", "rb"):
+        tool = tools.add_parser(name)
+        tool.add_argument("palette_name")
+        tool.add_argument("paths", nargs="*")
+    for name, modes in (("y", ("sgb", "gbc", "all")), ("gs97", ("normal", "shiny", "all"))):
+        tool = tools.add_parser(name)
+        tool.add_argument("mode", choices=modes)
+        tool.add_argument("palette_name")
+        tool.add_argument("paths", nargs="*")
+    for name in ("g2rb", "rb2g"):
+        tool = tools.add_parser(name)
+        tool.add_argument("paths", nargs="*")
+    return parser.parse_args(argv)
+
+def tool_args(args):
+    if args.tool in ("g", "rb"):
+        return (args.palette_name.lower(),)
+    if args.tool in ("y", "gs97"):
+        return (args.mode, args.palette_name.lower())
+    return ()
+
+def colorize_options(args):
+    return {"profile": args.encode, "bitdepth": args.bitdepth, "to": args.to,
+            "width": args.width, "columns": args.columns, "stream": args.stream}
+
+def main():
+    args = parse_args()
+    if args.tool not in ("g2rb", "rb2g"):
+        if args.palette_name.lower() not in palette_names(args.tool) and args.palette_name.lower() not in ("all", "auto"):
+            print(f"Incorrect palette name!\nType python sgbpal_{args.tool}.py -help to see all palettes", file=sys.stderr)
+            sys.exit(1)
+    if args.stream and args.encode == "archival":
+        print("The archival profile can't be streamed!", file=sys.stderr)
+        sys.exit(1)
+    if args.pipeline and (args.cache or args.stream or args.to == "2bpp"):
+        print("-p can't be used with --cache, -s or -t 2bpp!", file=sys.stderr)
+        sys.exit(1)
+    if args.bank and (args.tool in ("g2rb", "rb2g") or args.pipeline or args.cache or args.stream or args.to):
+        print("--bank only takes the colorizers, without -p, --cache, -s or -t!", file=sys.stderr)
+        sys.exit(1)
+    paths = list(args.paths)
+    for manifest in args.manifest:
+        paths.extend(read_manifest(manifest))
+    filenames = list(dict.fromkeys(find_pngs(paths, args.recursive)))
+    if not filenames:
+        print("Please enter at least one valid PNG file or directory!", file=sys.stderr)
+        sys.exit(1)
+    if profiling.ENABLED:
+        # profile the work in this process
+        args.jobs = 1
+    cache = None
+    if args.cache:
+        max_size = None if args.cache_size is None else args.cache_size * 1024 * 1024
+        cache = cache_module.Cache(args.cache, max_size, args.cache_link)
+    if args.bank:
+        errors = run_bank(args.tool, tool_args(args), filenames, args.bank, args.jobs, args.chunksize,
+                          args.bank_slots, colorize_options(args))
+    elif args.pipeline:
+        errors = asyncio.run(run_pipelined(args.tool, tool_args(args), filenames, args.jobs, args.in_flight,
+                                           args.prefetch, args.io, colorize_options(args)))
+    else:
+        errors = run_batch(args.tool, tool_args(args), filenames, args.jobs, args.chunksize, cache, colorize_options(args))
+    print_summary(len(filenames), errors)
+    if cache is not None:
+        cache.evict()
+        cache.save_stats()
+        print("Cache: " + cache_module.format_stats(cache.hits, cache.misses, cache.bytes_saved), file=sys.stderr)
+    if errors:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    profiling.run(main)
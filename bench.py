@@ -0,0 +1,715 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Usage: python bench.py [-n repeat] [--json out.json] [--compare old.json] colorize|whiteswap|batch|encode|memory|server|startup|pipeline|scan|identify|bank|watch|stages
+
+Benchmarks of the colorization tools, run on synthetic
+grayscale sprites written to a temporary directory. stages
+times every stage of colorize() and of the white swaps, and
+can write its results as JSON, or compare them with earlier
+ones.
+"""
+
+import argparse
+import asyncio
+import glob
+import io
+import json
+import platform
+import os
+import queue
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import png
+from PIL import Image
+
+import bank as bank_module
+import batch
+import identify
+import pipeline
+import scan
+import sgbpal
+import watch
+import whiteswap
+from registry import REGISTRY
+from sgbpal import rgb8_to_rgb5, rgb5_to_rgb8, luminance, invert, is_grayscale
+
+GRAYS = tuple(rgb5_to_rgb8((v, v, v)) for v in (31, 21, 10, 0))
+COLORS = ((30,31,29), (31,20,10), (26,10,6), (3,2,2))
+GREEN_COLORS = tuple(map(rgb5_to_rgb8, COLORS))
+
+def make_sprite(width, height, grays=GRAYS, seed=0):
+    """PNG bytes of a blocky RGB sprite using the given colors."""
+    rng = random.Random(seed)
+    rows = []
+    for y in range(height):
+        if y % 4 == 0:
+            row = []
+            for x in range(0, width, 4):
+                row.extend(rng.choice(grays) * min(4, width - x))
+        rows.append(row)
+    out = io.BytesIO()
+    png.Writer(width, height, greyscale=False, bitdepth=8).write(out, rows)
+    return out.getvalue()
+
+def make_gray(width, height, bitdepth, seed=0):
+    """PNG bytes of a blocky grayscale sprite of the given bit depth, as pokered and rgbgfx write them."""
+    # the 4 grays, or black and white at 1 bit
+    levels = [0, 1] if bitdepth == 1 else [v * ((1 << bitdepth) - 1) // 3 for v in range(4)]
+    rng = random.Random(seed)
+    rows = []
+    for y in range(height):
+        if y % 4 == 0:
+            row = []
+            for x in range(0, width, 4):
+                row.extend([rng.choice(levels)] * min(4, width - x))
+        rows.append(row)
+    out = io.BytesIO()
+    png.Writer(width, height, greyscale=True, bitdepth=bitdepth).write(out, rows)
+    return out.getvalue()
+
+def make_indexed(data):
+    """The sprite indexed with the grayscale palette, as colorize() writes it."""
+    keys = sgbpal.rgb5_keys(sgbpal.read_rgba8(io.BytesIO(data)))
+    palette = sgbpal.sort_palette(sgbpal.color_set(keys))
+    out = io.BytesIO()
+    sgbpal.write_indexed(out, sgbpal.index_pixels(keys, palette), tuple(map(rgb5_to_rgb8, palette)))
+    return out.getvalue()
+
+def legacy_colorize(filename, colors):
+    """The original per-pixel colorize() of the sgbpal_* scripts."""
+    def rgb5_pixels(row):
+        yield from (rgb8_to_rgb5(row[x:x+3]) for x in range(0, len(row), 4))
+    with open(filename, "rb") as file:
+        width, height, rows = png.Reader(file).asRGBA8()[:3]
+        rows = list(rows)
+    b_and_w = {(0, 0, 0), (31, 31, 31)}
+    colors_set = {c for row in rows for c in rgb5_pixels(row)} - b_and_w
+    if not colors_set:
+        colors_set = {(21, 21, 21), (10, 10, 10)}
+    elif len(colors_set) == 1:
+        c = colors_set.pop()
+        colors_set = {c, invert(c)}
+    elif len(colors_set) != 2:
+        return False
+    palette = tuple(sorted(colors_set | b_and_w, key=luminance, reverse=True))
+    assert len(palette) == 4
+    rows = [list(map(palette.index, rgb5_pixels(row))) for row in rows]
+    if is_grayscale(palette):
+        palette = tuple(map(rgb5_to_rgb8, colors))
+        writer = png.Writer(width, height, palette=palette, bitdepth=8, compression=9)
+    with open(filename, "wb") as file:
+        writer.write(file, rows)
+    return True
+
+def time_colorize(func, sources, tmpdir, repeat):
+    best = None
+    outputs = []
+    for _ in range(repeat):
+        paths = []
+        for i, data in enumerate(sources):
+            path = os.path.join(tmpdir, f"{i}.png")
+            with open(path, "wb") as file:
+                file.write(data)
+            paths.append(path)
+        start = time.perf_counter()
+        for path in paths:
+            func(path, COLORS)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+        outputs = []
+        for path in paths:
+            with open(path, "rb") as file:
+                outputs.append(file.read())
+    return best, outputs
+
+def bench_colorize(repeat):
+    cases = [("56x56 fronts x200", [make_sprite(56, 56, seed=i) for i in range(200)]),
+             ("1024x1024 sheet", [make_sprite(1024, 1024)]),
+             ("1-color 56x56 x50", [make_sprite(56, 56, GRAYS[:1] + GRAYS[3:], seed=i) for i in range(50)]),
+             ("2-color 56x56 x50", [make_sprite(56, 56, GRAYS[:2] + GRAYS[3:], seed=i) for i in range(50)]),
+             ("indexed 56x56 x200", [make_indexed(make_sprite(56, 56, seed=i)) for i in range(200)]),
+             ("1-bit gray 56x56 x50", [make_gray(56, 56, 1, seed=i) for i in range(50)]),
+             ("2-bit gray 56x56 x50", [make_gray(56, 56, 2, seed=i) for i in range(50)]),
+             ("16-bit gray 56x56 x50", [make_gray(56, 56, 16, seed=i) for i in range(50)])]
+    tmpdir = tempfile.mkdtemp()
+    try:
+        print(f"{'case':<22}{'legacy':>10}{'numpy':>10}{'speedup':>10}  identical")
+        for name, sources in cases:
+            legacy, expected = time_colorize(legacy_colorize, sources, tmpdir, repeat)
+            engine, outputs = time_colorize(sgbpal.colorize, sources, tmpdir, repeat)
+            print(f"{name:<22}{legacy:>9.3f}s{engine:>9.3f}s{legacy / engine:>9.1f}x  {outputs == expected}")
+    finally:
+        shutil.rmtree(tmpdir)
+
+def legacy_swap_white(filename, old, new):
+    """The original per-pixel g2rb()/rb2g()."""
+    img = Image.open(filename)
+    img = img.convert("RGB")
+    datas = img.getdata()
+    new_image_data = []
+    for item in datas:
+        if item[0] == old[0] and item[1] == old[1] and item[2] == old[2]:
+            new_image_data.append(new)
+        else:
+            new_image_data.append(item)
+    img.putdata(new_image_data)
+    img_index = img.convert("P", palette=Image.ADAPTIVE, colors=5)
+    img_index.save(filename)
+    return True
+
+def time_swap(func, source, path):
+    with open(path, "wb") as file:
+        file.write(source)
+    start = time.perf_counter()
+    func(path, whiteswap.GREEN_WHITE, whiteswap.RB_WHITE)
+    elapsed = time.perf_counter() - start
+    with open(path, "rb") as file:
+        output = file.read()
+    with Image.open(path) as img:
+        return elapsed, output, img.convert("RGB").tobytes()
+
+def bench_whiteswap(repeat):
+    rgb = make_sprite(4096, 4096, GREEN_COLORS)
+    indexed = io.BytesIO()
+    Image.open(io.BytesIO(rgb)).convert("P", palette=Image.ADAPTIVE, colors=4).save(indexed, "PNG")
+    fast = lambda filename, old, new: whiteswap.swap_white(filename, old, new, "fast")
+    cases = [("4096x4096 RGB", rgb, whiteswap.swap_white), ("4096x4096 RGB, fast", rgb, fast),
+             ("4096x4096 indexed", indexed.getvalue(), whiteswap.swap_white)]
+    tmpdir = tempfile.mkdtemp()
+    path = os.path.join(tmpdir, "sheet.png")
+    try:
+        print(f"{'case':<22}{'legacy':>10}{'numpy':>10}{'speedup':>10}  identical  same pixels")
+        for name, source, swap in cases:
+            legacy = engine = None
+            for _ in range(repeat):
+                t, expected, expected_pixels = time_swap(legacy_swap_white, source, path)
+                legacy = t if legacy is None else min(legacy, t)
+                t, output, pixels = time_swap(swap, source, path)
+                engine = t if engine is None else min(engine, t)
+            print(f"{name:<22}{legacy:>9.3f}s{engine:>9.3f}s{legacy / engine:>9.1f}x  "
+                  f"{str(output == expected):<9}  {pixels == expected_pixels}")
+    finally:
+        shutil.rmtree(tmpdir)
+
+def bench_batch(repeat):
+    sources = [make_sprite(56, 56, seed=i) for i in range(2000)]
+    tmpdir = tempfile.mkdtemp()
+    filenames = [os.path.join(tmpdir, f"{i}.png") for i in range(len(sources))]
+    jobs = 1
+    try:
+        print(f"{'jobs':<6}{'time':>10}{'files/s':>10}{'scaling':>10}")
+        while True:
+            best = None
+            for _ in range(repeat):
+                for filename, data in zip(filenames, sources):
+                    with open(filename, "wb") as file:
+                        file.write(data)
+                start = time.perf_counter()
+                batch.run_batch("rb", ("redmon",), filenames, jobs)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            if jobs == 1:
+                single = best
+            print(f"{jobs:<6}{best:>9.3f}s{len(filenames) / best:>10.0f}{single / best:>9.1f}x")
+            if jobs >= (os.cpu_count() or 1):
+                break
+            jobs = min(jobs * 2, os.cpu_count())
+        best = None
+        for _ in range(repeat):
+            for filename, data in zip(filenames, sources):
+                with open(filename, "wb") as file:
+                    file.write(data)
+            start = time.perf_counter()
+            asyncio.run(batch.run_pipelined("rb", ("redmon",), filenames, jobs))
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        print(f"{f'{jobs} -p':<6}{best:>9.3f}s{len(filenames) / best:>10.0f}{single / best:>9.1f}x")
+    finally:
+        shutil.rmtree(tmpdir)
+
+def bench_encode(repeat):
+    cases = [("56x56 fronts x50", [make_sprite(56, 56, seed=i) for i in range(50)]),
+             ("64x64 fronts x50", [make_sprite(64, 64, seed=i) for i in range(50)]),
+             ("1024x1024 sheet", [make_sprite(1024, 1024)])]
+    print(f"{'case':<22}{'profile':<10}{'bpp':>4}{'time':>10}{'bytes':>10}")
+    for name, sources in cases:
+        images = []
+        for data in sources:
+            keys = sgbpal.rgb5_keys(sgbpal.read_rgba8(io.BytesIO(data)))
+            palette = sgbpal.sort_palette(sgbpal.color_set(keys))
+            images.append((sgbpal.index_pixels(keys, palette), tuple(map(rgb5_to_rgb8, COLORS))))
+        for profile in sgbpal.PROFILES:
+            for bitdepth in (8, 2):
+                best = None
+                for _ in range(repeat):
+                    out = io.BytesIO()
+                    start = time.perf_counter()
+                    for indices, palette in images:
+                        sgbpal.write_indexed(out, indices, palette, profile, bitdepth)
+                    elapsed = time.perf_counter() - start
+                    best = elapsed if best is None else min(best, elapsed)
+                print(f"{name:<22}{profile:<10}{bitdepth:>4}{best:>9.3f}s{len(out.getvalue()):>10}")
+
+def make_sheet(filename, width, height, seed=0):
+    """Write a blocky RGB sheet with the grayscale colors one row at a time."""
+    rng = np.random.default_rng(seed)
+    grays = np.array(GRAYS, dtype=np.uint8)
+    def rows():
+        for y in range(0, height, 4):
+            row = grays[rng.integers(0, 4, width // 4)].repeat(4, axis=0).ravel()
+            for _ in range(min(4, height - y)):
+                yield row
+    with open(filename, "wb") as file:
+        png.Writer(width, height, greyscale=False, bitdepth=8).write_packed(file, rows())
+
+def peak_rss(code):
+    """Peak RSS in MiB of a Python process running code after importing sgbpal."""
+    script = f"import resource, sgbpal\n{code}\nprint(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)"
+    out = subprocess.run([sys.executable, "-c", script], check=True, capture_output=True, text=True,
+                         cwd=os.path.dirname(os.path.abspath(__file__)))
+    # kilobytes on Linux
+    return int(out.stdout.split()[-1]) / 1024
+
+def bench_memory(repeat):
+    width = 1024
+    tmpdir = tempfile.mkdtemp()
+    try:
+        baseline = peak_rss("")
+        print(f"baseline after imports: {baseline:.1f} MiB")
+        print(f"{'sheet':<14}{'mode':<8}{'time':>10}{'peak RSS':>12}{'over baseline':>15}")
+        for height in (1024, 4096, 16384):
+            filename = os.path.join(tmpdir, "sheet.png")
+            make_sheet(filename, width, height)
+            for mode, function in (("whole", "colorize_all"), ("stream", "colorize_stream")):
+                output = os.path.join(tmpdir, f"sheet_{mode}.png")
+                code = f"sgbpal.{function}({filename!r}, {{{output!r}: {COLORS!r}}})"
+                best = rss = None
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    rss = peak_rss(code)
+                    elapsed = time.perf_counter() - start
+                    best = elapsed if best is None else min(best, elapsed)
+                print(f"{width}x{height:<9}{mode:<8}{best:>9.3f}s{rss:>8.1f} MiB{rss - baseline:>11.1f} MiB")
+            with open(os.path.join(tmpdir, "sheet_whole.png"), "rb") as a, \
+                 open(os.path.join(tmpdir, "sheet_stream.png"), "rb") as b:
+                assert a.read() == b.read(), "streamed output differs"
+    finally:
+        shutil.rmtree(tmpdir)
+
+def percentiles(latencies):
+    latencies = sorted(latencies)
+    return (latencies[len(latencies) // 2] * 1000,
+            latencies[min(len(latencies) - 1, len(latencies) * 99 // 100)] * 1000)
+
+async def load_client(port, body, target, requests, connections):
+    """Latencies of requests sent over keep-alive connections, and the total time."""
+    request = (f"POST {target} HTTP/1.1\r\nHost: localhost\r\n"
+               f"Content-Length: {len(body)}\r\n\r\n").encode() + body
+    latencies = []
+    async def connection(count):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        for _ in range(count):
+            start = time.perf_counter()
+            writer.write(request)
+            status = await reader.readline()
+            length = 0
+            while (line := await reader.readline()) != b"\r\n":
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":")[1])
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - start)
+            assert status.split()[1] == b"200", status
+        writer.close()
+    start = time.perf_counter()
+    await asyncio.gather(*(connection(requests // connections) for _ in range(connections)))
+    return latencies, time.perf_counter() - start
+
+def bench_server(repeat):
+    here = os.path.dirname(os.path.abspath(__file__))
+    body = make_sprite(56, 56)
+    print(f"{'client':<26}{'requests':>9}{'p50':>10}{'p99':>10}{'req/s':>10}")
+    tmpdir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmpdir, "pic.png")
+        latencies = []
+        start = time.perf_counter()
+        for _ in range(20 * repeat):
+            t = time.perf_counter()
+            with open(filename, "wb") as file:
+                file.write(body)
+            subprocess.run([sys.executable, os.path.join(here, "sgbpal_y.py"), "gbc", "bluemon", filename], check=True)
+            with open(filename, "rb") as file:
+                file.read()
+            latencies.append(time.perf_counter() - t)
+        elapsed = time.perf_counter() - start
+        p50, p99 = percentiles(latencies)
+        print(f"{'CLI sgbpal_y.py':<26}{len(latencies):>9}{p50:>8.2f}ms{p99:>8.2f}ms{len(latencies) / elapsed:>10.0f}")
+    finally:
+        shutil.rmtree(tmpdir)
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    target = "/colorize?game=y&mode=gbc&palette=bluemon"
+    for jobs in (None, os.cpu_count() or 1):
+        command = [sys.executable, os.path.join(here, "server.py"), "-p", str(port)]
+        if jobs is not None:
+            command += ["-j", str(jobs)]
+        server = subprocess.Popen(command, stderr=subprocess.PIPE, text=True)
+        try:
+            server.stderr.readline()
+            for connections in (1, 8, 32):
+                result = asyncio.run(load_client(port, body, target, 500 * repeat // connections * connections, connections))
+                latencies, elapsed = result
+                p50, p99 = percentiles(latencies)
+                name = f"server{'' if jobs is None else f' -j {jobs}'}, {connections} conn"
+                print(f"{name:<26}{len(latencies):>9}{p50:>8.2f}ms{p99:>8.2f}ms{len(latencies) / elapsed:>10.0f}")
+        finally:
+            # lets the server shut its process pool down
+            server.send_signal(signal.SIGINT)
+            server.wait()
+
+# import time budgets in ms of the modules that must not import NumPy, pypng or Pillow
+IMPORT_BUDGETS = {"colors": 10, "pkmncolor": 20, "sgbpal_g": 20, "sgbpal_rb": 20, "sgbpal_y": 20,
+                  "sgbpal_gs97": 20, "g2rb": 20, "rb2g": 20}
+HEAVY_MODULES = ("numpy", "png", "PIL")
+
+def import_time(module):
+    """Cumulative import time in ms of a module, and the heavy modules it imports."""
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], check=True,
+                         capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    total = None
+    heavy = set()
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line[12:]:
+            continue
+        self_us, cumulative_us, name = line[12:].split("|")
+        name = name.strip()
+        if name.split(".")[0] in HEAVY_MODULES:
+            heavy.add(name.split(".")[0])
+        if name == module:
+            total = int(cumulative_us) / 1000
+    return total, sorted(heavy)
+
+def bench_startup(repeat):
+    here = os.path.dirname(os.path.abspath(__file__))
+    print(f"{'module':<14}{'import':>10}{'budget':>10}  {'heavy imports':<18}status")
+    for module in list(IMPORT_BUDGETS) + ["sgbpal", "whiteswap"]:
+        best = heavy = None
+        for _ in range(repeat):
+            t, heavy = import_time(module)
+            best = t if best is None else min(best, t)
+        budget = IMPORT_BUDGETS.get(module)
+        if budget is None:
+            status = ""
+        elif heavy or best > budget:
+            status = "OVER BUDGET"
+        else:
+            status = "ok"
+        budget = "-" if budget is None else f"{budget}ms"
+        print(f"{module:<14}{best:>8.1f}ms{budget:>10}  {', '.join(heavy) or '-':<18}{status}")
+    print(f"\n{'command':<28}{'time':>10}")
+    for script in ("sgbpal_g.py", "sgbpal_rb.py", "sgbpal_y.py", "sgbpal_gs97.py"):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, os.path.join(here, script), "-help"], check=True, capture_output=True)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        print(f"{script + ' -help':<28}{best * 1000:>8.1f}ms")
+
+def bench_pipeline(repeat):
+    import rb2g
+    import sgbpal_rb
+    sources = [make_sprite(56, 56, seed=i) for i in range(50)]
+    steps = [pipeline.parse_step(step) for step in ("rb:all", "rb2g")]
+    tmpdir = tempfile.mkdtemp()
+    try:
+        def chained(filename):
+            sgbpal_rb.colorize(filename, "all", sgbpal_rb.palettes)
+            for output in batch.tool_outputs("rb", ("all",), filename):
+                rb2g.rb2g(output)
+        def piped(filename):
+            pipeline.run(filename, steps)
+        print(f"{'case':<30}{'time':>10}")
+        for name, function in (("sgbpal_rb.py all + rb2g.py", chained), ("pipeline.py rb:all rb2g", piped)):
+            best = None
+            for _ in range(repeat):
+                filenames = []
+                for i, data in enumerate(sources):
+                    filenames.append(os.path.join(tmpdir, f"{i}.png"))
+                    with open(filenames[-1], "wb") as file:
+                        file.write(data)
+                start = time.perf_counter()
+                for filename in filenames:
+                    function(filename)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            print(f"{name:<30}{best:>9.3f}s")
+    finally:
+        shutil.rmtree(tmpdir)
+
+def bench_scan(repeat):
+    colors = [(255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 255, 0), (0, 255, 255), (255, 0, 255)]
+    sources = [make_sprite(56, 56, seed=i) for i in range(2000)]
+    sources[::4] = map(make_indexed, sources[::4])
+    sources[1::4] = [make_sprite(56, 56, colors, seed=i) for i in range(0, 2000, 4)]
+    tmpdir = tempfile.mkdtemp()
+    filenames = [os.path.join(tmpdir, f"{i}.png") for i in range(len(sources))]
+    try:
+        def write_sources():
+            for filename, data in zip(filenames, sources):
+                with open(filename, "wb") as file:
+                    file.write(data)
+        print(f"{'case':<30}{'time':>10}{'files/s':>10}")
+        for name, function in (("batch.py rb redmon", lambda: batch.run_batch("rb", ("redmon",), filenames)),
+                               ("scan.py", lambda: list(scan.scan_all(filenames)))):
+            best = None
+            for _ in range(repeat):
+                write_sources()
+                start = time.perf_counter()
+                function()
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            print(f"{name:<30}{best:>9.3f}s{len(filenames) / best:>10.0f}")
+        sheet = os.path.join(tmpdir, "sheet.png")
+        with open(sheet, "wb") as file:
+            file.write(make_sprite(1024, 1024, colors))
+        best = min(timeit_once(lambda: scan.scan(sheet)) for _ in range(repeat))
+        print(f"{'scan.py 1024x1024 too many':<30}{best:>9.3f}s")
+    finally:
+        shutil.rmtree(tmpdir)
+
+def bench_identify(repeat):
+    palettes = list(REGISTRY.builtins().items())
+    sources = []
+    for i in range(2000):
+        chunks = sgbpal.read_chunks(make_indexed(make_sprite(56, 56, seed=i)))
+        sources.append(sgbpal.with_palette(chunks, palettes[i % len(palettes)][1].rgb8))
+    tmpdir = tempfile.mkdtemp()
+    filenames = [os.path.join(tmpdir, f"{i}.png") for i in range(len(sources))]
+    try:
+        for filename, data in zip(filenames, sources):
+            with open(filename, "wb") as file:
+                file.write(data)
+        index = identify.palette_index()
+        colors = set(palettes[0][1].colors)
+        lookup = min(timeit_once(lambda: [identify.lookup(colors, index) for _ in range(10000)])
+                     for _ in range(repeat)) / 10000
+        print(f"{'lookup':<30}{lookup * 1e6:>8.2f}us")
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            reports = list(identify.identify_all(filenames))
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        right = sum(report["palettes"] == identify.format_match(*palettes[i % len(palettes)][0])
+                    for i, report in enumerate(reports))
+        print(f"{'identify.py, 2000 sprites':<30}{best:>9.3f}s{len(filenames) / best:>10.0f} files/s, {right} right")
+    finally:
+        shutil.rmtree(tmpdir)
+
+def bench_bank(repeat):
+    sources = [make_sprite(56, 56, seed=i) for i in range(500)]
+    tmpdir = tempfile.mkdtemp()
+    filenames = [os.path.join(tmpdir, f"{i}.png") for i in range(len(sources))]
+    bank_filename = os.path.join(tmpdir, "sprites.bank")
+    try:
+        def write_sources():
+            for filename, data in zip(filenames, sources):
+                with open(filename, "wb") as file:
+                    file.write(data)
+        print(f"{'case':<30}{'time':>10}{'variants/s':>12}")
+        for name, function in (("batch.py -b 2 y all all", lambda: batch.run_batch("y", ("all", "all"), filenames,
+                                                                            options={"bitdepth": 2})),
+                               ("batch.py --bank y all all", lambda: batch.run_bank("y", ("all", "all"), filenames,
+                                                                             bank_filename, slot_count=1 << 15))):
+            best = None
+            for _ in range(repeat):
+                write_sources()
+                if os.path.exists(bank_filename):
+                    os.remove(bank_filename)
+                start = time.perf_counter()
+                function()
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            print(f"{name:<30}{best:>9.3f}s{len(filenames) * 20 / best:>12.0f}")
+        with bank_module.Bank(bank_filename) as bank:
+            keys = list(bank.items())
+            outputs = sorted(set(glob.glob(os.path.join(tmpdir, "*.png"))) - set(filenames))
+
+            def read_files():
+                for output in outputs:
+                    with open(output, "rb") as file:
+                        file.read()
+
+            for name, function in (("read PNG files", read_files),
+                                   ("Bank.png()", lambda: [bank.png(*key) for key in keys]),
+                                   ("Bank.png_parts()", lambda: [bank.png_parts(*key) for key in keys])):
+                best = min(timeit_once(function) for _ in range(repeat)) / len(keys)
+                print(f"{name:<30}{best * 1e6:>8.2f}us")
+        print(f"{'bank size':<30}{os.path.getsize(bank_filename) / 1024:>8.0f}kB, "
+              f"{sum(map(os.path.getsize, outputs)) / 1024:.0f}kB of PNG files")
+    finally:
+        shutil.rmtree(tmpdir)
+
+def bench_watch(repeat):
+    sources = [make_sprite(56, 56, seed=i) for i in range(2)]
+    tmpdir = tempfile.mkdtemp()
+    source, output = os.path.join(tmpdir, "src"), os.path.join(tmpdir, "out")
+    try:
+        for i in range(10000):
+            os.makedirs(os.path.join(source, str(i // 500)), exist_ok=True)
+            with open(os.path.join(source, str(i // 500), f"{i}.png"), "wb") as file:
+                file.write(sources[0])
+        options = {"profile": "default", "bitdepth": None}
+        with watch.Watcher(source, output, "y", ("gbc", "redmon"), options) as watcher:
+            print(f"{'initial run, 10000 sprites':<30}{timeit_once(watcher.update):>9.3f}s")
+        with watch.Watcher(source, output, "y", ("gbc", "redmon"), options) as watcher:
+            best = min(timeit_once(watcher.update) for _ in range(repeat))
+            print(f"{'run without changes':<30}{best:>9.3f}s")
+            best = min(timeit_once(lambda: watch.snapshot(source)) for _ in range(repeat))
+            print(f"{'poll of the source tree':<30}{best * 1000:>8.1f}ms")
+            reports = queue.Queue()
+            stop = threading.Event()
+            thread = threading.Thread(target=watcher.run, args=(0.25, reports.put, stop))
+            thread.start()
+            edited = os.path.join(source, "7", "3500.png")
+            for i in range(10 * repeat):
+                time.sleep(0.3)
+                with open(edited, "wb") as file:
+                    file.write(sources[(i + 1) % 2])
+                reports.get(timeout=10)
+            stop.set()
+            thread.join()
+            p50, p99 = percentiles(watcher.latencies)
+            print(f"{'edit to output latency':<30}{p50:>8.1f}ms p50{p99:>8.1f}ms p99")
+    finally:
+        shutil.rmtree(tmpdir)
+
+def timeit_once(function):
+    start = time.perf_counter()
+    function()
+    return time.perf_counter() - start
+
+def time_call(function, repeat, number):
+    """Best time in seconds of a call over repeat runs of number calls."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        elapsed = (time.perf_counter() - start) / number
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def colorize_stages(data, repeat, number):
+    """Seconds per call of every stage of colorize() on PNG bytes."""
+    pixels = sgbpal.read_rgba8(io.BytesIO(data))
+    keys = sgbpal.rgb5_keys(pixels)
+    palette = sgbpal.sort_palette(sgbpal.color_set(keys))
+    indices = sgbpal.index_pixels(keys, palette)
+    colors = tuple(map(rgb5_to_rgb8, COLORS))
+    return {"decode": time_call(lambda: sgbpal.read_rgba8(io.BytesIO(data)), repeat, number),
+            "quantize": time_call(lambda: sgbpal.rgb5_keys(pixels), repeat, number),
+            "color set": time_call(lambda: sgbpal.sort_palette(sgbpal.color_set(keys)), repeat, number),
+            "index": time_call(lambda: sgbpal.index_pixels(keys, palette), repeat, number),
+            "encode": time_call(lambda: sgbpal.write_indexed(io.BytesIO(), indices, colors), repeat, number),
+            "total": time_call(lambda: sgbpal.colorize_data(data, COLORS), repeat, number)}
+
+def swap_stages(data, old, new, repeat, number):
+    """Seconds per call of every stage of a white swap on PNG bytes."""
+    def decode():
+        img = Image.open(io.BytesIO(data))
+        img.load()
+        return img
+    def swap():
+        img = decode()
+        start = time.perf_counter()
+        whiteswap.swapped(img, old, new)
+        return time.perf_counter() - start
+    img = whiteswap.swapped(decode(), old, new)
+    return {"decode": time_call(decode, repeat, number),
+            "swap": min(sum(swap() for _ in range(number)) / number for _ in range(repeat)),
+            "encode": time_call(lambda: img.save(io.BytesIO(), "PNG"), repeat, number),
+            "total": time_call(lambda: whiteswap.swap_white_data(data, old, new), repeat, number)}
+
+def bench_stages(repeat):
+    gray_sprite = make_sprite(56, 56)
+    green_sprite = make_sprite(56, 56, GREEN_COLORS)
+    rb_sprite = whiteswap.swap_white_data(green_sprite, whiteswap.GREEN_WHITE, whiteswap.RB_WHITE)
+    cases = {"colorize 56x56 front": lambda: colorize_stages(gray_sprite, repeat, 50),
+             "colorize 64x64 gs97 front": lambda: colorize_stages(make_sprite(64, 64), repeat, 50),
+             "colorize 1024x1024 sheet": lambda: colorize_stages(make_sprite(1024, 1024), repeat, 1),
+             "colorize 1-color 56x56": lambda: colorize_stages(make_sprite(56, 56, GRAYS[:1]), repeat, 50),
+             "colorize 2-color 56x56": lambda: colorize_stages(make_sprite(56, 56, GRAYS[::3]), repeat, 50),
+             "colorize 3-color 56x56": lambda: colorize_stages(make_sprite(56, 56, GRAYS[:2] + GRAYS[3:]), repeat, 50),
+             "indexed 56x56 front": lambda: colorize_stages(make_indexed(gray_sprite), repeat, 50),
+             "g2rb 56x56 RGB": lambda: swap_stages(green_sprite, whiteswap.GREEN_WHITE, whiteswap.RB_WHITE, repeat, 50),
+             "rb2g 56x56 indexed": lambda: swap_stages(rb_sprite, whiteswap.RB_WHITE, whiteswap.GREEN_WHITE, repeat, 50),
+             "g2rb 1024x1024 sheet": lambda: swap_stages(make_sprite(1024, 1024, GREEN_COLORS),
+                                                         whiteswap.GREEN_WHITE, whiteswap.RB_WHITE, repeat, 1)}
+    results = {}
+    print(f"{'case':<28}{'stage':<12}{'per call':>12}")
+    for name, run in cases.items():
+        results[name] = run()
+        for stage, seconds in results[name].items():
+            print(f"{name:<28}{stage:<12}{seconds * 1e6:>10.1f}us")
+    return {"python": platform.python_version(), "numpy": np.__version__, "png": png.__version__,
+            "stages": results}
+
+def compare_results(old, new, threshold=1.2):
+    """Print the ratio of new stage times to old ones, flagging regressions."""
+    print(f"\n{'case':<28}{'stage':<12}{'old':>12}{'new':>12}{'ratio':>8}")
+    for case, stages in new["stages"].items():
+        for stage, seconds in stages.items():
+            before = old.get("stages", {}).get(case, {}).get(stage)
+            if before is None:
+                continue
+            ratio = seconds / before
+            flag = "  slower" if ratio > threshold else ""
+            print(f"{case:<28}{stage:<12}{before * 1e6:>10.1f}us{seconds * 1e6:>10.1f}us{ratio:>7.2f}x{flag}")
+
+BENCHMARKS = {"colorize": bench_colorize,
+              "whiteswap": bench_whiteswap,
+              "batch": bench_batch,
+              "encode": bench_encode,
+              "memory": bench_memory,
+              "server": bench_server,
+              "startup": bench_startup,
+              "pipeline": bench_pipeline,
+              "scan": bench_scan,
+              "identify": bench_identify,
+              "bank": bench_bank,
+              "watch": bench_watch,
+              "stages": bench_stages}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the colorization tools.")
+    parser.add_argument("-n", "--repeat", type=int, default=3, help="runs per case, best is kept")
+    parser.add_argument("--json", metavar="FILE", help="write the results as JSON (stages)")
+    parser.add_argument("--compare", metavar="FILE", help="compare the results with a JSON file (stages)")
+    parser.add_argument("benchmark", choices=BENCHMARKS)
+    args = parser.parse_args()
+    results = BENCHMARKS[args.benchmark](args.repeat)
+    if results is None:
+        return
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            compare_results(json.load(file), results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+if __name__ == '__main__':
+    main()
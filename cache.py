@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Usage: python cache.py cache_dir
+
+Content-addressed cache of the outputs of the tools, used by
+batch.py --cache. Outputs are keyed by the digest of the input
+file and by what produced them (tool, mode, palette name and
+palette values). The least recently used outputs are evicted
+beyond a size cap. Print the statistics of a cache directory.
+"""
+
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+VERSION = b"1"
+
+class Cache:
+    def __init__(self, directory, max_size=None, link=False):
+        self.directory = directory
+        self.max_size = max_size
+        self.link = link
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+    def key(self, digest, *parts):
+        h = hashlib.sha256(VERSION)
+        h.update(digest)
+        h.update(repr(parts).encode())
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, "objects", key[:2], key[2:])
+
+    def fetch(self, keys):
+        """
+        Write the cached outputs of output filename -> key.
+        Return False, without writing anything, unless all
+        of them are cached.
+        """
+        paths = {output: self.path(key) for output, key in keys.items()}
+        if not all(os.path.exists(path) for path in paths.values()):
+            return False
+        for output, path in paths.items():
+            fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(output) or ".")
+            os.close(fd)
+            try:
+                if self.link:
+                    os.remove(tmp)
+                    os.link(path, tmp)
+                else:
+                    shutil.copyfile(path, tmp)
+                os.replace(tmp, output)
+            except BaseException:
+                with contextlib.suppress(OSError):
+                    os.remove(tmp)
+                raise
+            # the modification time of an object is its last use
+            os.utime(path)
+        return True
+
+    def store(self, keys):
+        for output, key in keys.items():
+            path = self.path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+            os.close(fd)
+            shutil.copyfile(output, tmp)
+            os.replace(tmp, path)
+
+    def objects(self):
+        for root, dirs, files in os.walk(os.path.join(self.directory, "objects")):
+            for name in files:
+                path = os.path.join(root, name)
+                st = os.stat(path)
+                yield st.st_mtime, st.st_size, path
+
+    def evict(self):
+        """Remove the least recently used objects beyond max_size bytes."""
+        if self.max_size is None:
+            return
+        objects = sorted(self.objects())
+        size = sum(s for t, s, p in objects)
+        for mtime, s, path in objects:
+            if size <= self.max_size:
+                break
+            os.remove(path)
+            size -= s
+
+    def stats_path(self):
+        return os.path.join(self.directory, "stats.json")
+
+    def load_stats(self):
+        try:
+            with open(self.stats_path(), encoding="utf-8") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {"hits": 0, "misses": 0, "bytes_saved": 0}
+
+    def save_stats(self):
+        """Add the statistics of this run to the ones of the cache directory."""
+        stats = self.load_stats()
+        stats["hits"] += self.hits
+        stats["misses"] += self.misses
+        stats["bytes_saved"] += self.bytes_saved
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.stats_path(), "w", encoding="utf-8") as file:
+            json.dump(stats, file)
+
+def file_digest(filename):
+    with open(filename, "rb") as file:
+        return hashlib.sha256(file.read()).digest()
+
+def format_stats(hits, misses, bytes_saved, size=None):
+    total = hits + misses
+    rate = hits / total * 100 if total else 0
+    report = f"{hits} hits, {misses} misses ({rate:.1f}% hit rate), {bytes_saved} bytes saved"
+    if size is not None:
+        report += f", {size} bytes cached"
+    return report
+
+def main():
+    if len(sys.argv) != 2:
+        print(f"Usage: {sys.argv[0]} cache_dir", file=sys.stderr)
+        sys.exit(1)
+    cache = Cache(sys.argv[1])
+    stats = cache.load_stats()
+    print(format_stats(stats["hits"], stats["misses"], stats["bytes_saved"],
+                       sum(s for t, s, p in cache.objects())))
+
+if __name__ == '__main__':
+    main()
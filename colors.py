@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Color helpers shared by the tools, in pure Python so that
+they can be imported without NumPy, pypng or Pillow.
+
+Colors are RGB555 (r, g, b) tuples of 0-31 values, as the Game
+Boy palettes, or RGB888 ones of 0-255 values, as PNG palettes.
+The atomic writes of the tools are here too, for the same reason.
+"""
+
+import contextlib
+import functools
+import os
+
+B_AND_W = {(0, 0, 0), (31, 31, 31)}
+GRAYSCALE = ((31, 31, 31), (21, 21, 21), (10, 10, 10), (0, 0, 0))
+
+# SGB white of the Pokémon Green and Red/Blue sprites, in RGB888
+GREEN_WHITE = (247, 255, 239)
+RB_WHITE = (255, 239, 255)
+
+def rgb8_to_rgb5(c):
+    r, g, b = c
+    return (r // 8, g // 8, b // 8)
+
+def rgb5_to_rgb8(c):
+    r, g, b = c
+    return (r * 8 + r // 4, g * 8 + g // 4, b * 8 + b // 4)
+
+def invert(c):
+    r, g, b = c
+    return (31 - r, 31 - g, 31 - b)
+
+def luminance(c):
+    r, g, b = c
+    return 0.299 * r**2 + 0.587 * g**2 + 0.114 * b**2
+
+def is_grayscale(palette):
+    return (palette == ((31, 31, 31), (21, 21, 21), (10, 10, 10), (0, 0, 0)) or
+        palette == ((31, 31, 31), (20, 20, 20), (10, 10, 10), (0, 0, 0)))
+
+def rgb5_key(c):
+    r, g, b = c
+    return r << 10 | g << 5 | b
+
+def key_rgb5(k):
+    return (k >> 10 & 31, k >> 5 & 31, k & 31)
+
+def plte_bytes(palette):
+    """PLTE chunk data of an RGB888 palette."""
+    return bytes(v for c in palette for v in c)
+
+def sort_palette(colors):
+    """
+    Sorted 4-color palette {white, light color, dark color, black}
+    for a set of RGB555 colors, or None if there are too many colors.
+    """
+    colors = set(colors) - B_AND_W
+    if not colors:
+        colors = {(21, 21, 21), (10, 10, 10)}
+    elif len(colors) == 1:
+        c = colors.pop()
+        colors = {c, invert(c)}
+    elif len(colors) != 2:
+        return None
+    palette = tuple(sorted(colors | B_AND_W, key=luminance, reverse=True))
+    assert len(palette) == 4
+    return palette
+
+def output_colors(palette, colors):
+    """
+    RGB555 palette to write: the chosen palette table entry
+    for grayscale sprites, the sprite's own colors otherwise.
+    """
+    return colors if is_grayscale(palette) else palette
+
+@functools.lru_cache(maxsize=1024)
+def output_palette(palette, colors):
+    return tuple(map(rgb5_to_rgb8, output_colors(palette, colors)))
+
+@contextlib.contextmanager
+def atomic_open(filename):
+    """
+    Binary file to write in place of filename: a temporary file,
+    renamed over it once closed, or removed on error, so that it
+    is never left half-written.
+    """
+    tmp = f"{filename}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "wb") as file:
+            yield file
+        os.replace(tmp, filename)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp)
+        raise
+
+def atomic_write(filename, data):
+    """Write bytes to a file through atomic_open()."""
+    with atomic_open(filename) as file:
+        file.write(data)
@@ -9,24 +9,16 @@ Pokémon Green sprites to those
 of Pokémon Red/Blue
 """
 
-from PIL import Image
-
 import sys
 
-def g2rb(filename):
-    img = Image.open(filename)
-    img = img.convert("RGB")
-    datas = img.getdata()
-    new_image_data = []
-    for item in datas:
-        if item[0] == 247 and item[1] == 255 and item[2] == 239:
-                new_image_data.append((255, 239, 255))
-        else:
-            new_image_data.append(item)
-    img.putdata(new_image_data)
-    img_index = img.convert("P", palette=Image.ADAPTIVE, colors=5)
-    img_index.save(filename)
-    return True
+import profiling
+from colors import GREEN_WHITE, RB_WHITE
+
+COLORS = (GREEN_WHITE, RB_WHITE)
+
+def g2rb(filename, profile="default"):
+    from whiteswap import swap_white
+    return swap_white(filename, *COLORS, profile)
 
 def main():
         if len(sys.argv) < 2:
@@ -40,4 +32,4 @@ def main():
                                 print(f"{filename}: error!", file=sys.stderr)
         		
 if __name__ == '__main__':
-	main()
+	profiling.run(main)
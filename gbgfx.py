@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Usage: python gbgfx.py [-w width] [-Z] pic.2bpp|pic.png
+
+Convert Game Boy 2bpp tile data to grayscale PNGs and back,
+as pokered/pokegold build them with rgbgfx: 8x8 tiles of 16
+bytes, a low and a high bit plane per row, the leftmost pixel
+in the top bit, color 0 being white and color 3 black.
+Tiles are in row-major order, or column-major with -Z.
+"""
+
+import argparse
+import math
+import os
+import sys
+
+import numpy as np
+
+import profiling
+from colors import atomic_open
+
+def decode_tiles(data):
+    """(tiles, 8, 8) color indices of planar 2bpp tile data."""
+    planes = np.unpackbits(np.frombuffer(data, dtype=np.uint8).reshape(-1, 8, 2), axis=2)
+    return planes[..., :8] | planes[..., 8:] << 1
+
+def encode_tiles(tiles):
+    """Planar 2bpp tile data of (tiles, 8, 8) color indices."""
+    planes = np.stack([tiles & 1, tiles >> 1 & 1], axis=2)
+    return np.packbits(planes, axis=3).tobytes()
+
+def tiles_to_pixels(tiles, width, columns=False):
+    """Arrange (tiles, 8, 8) tiles in a (height, width) image."""
+    tile_width = width // 8
+    tile_height = len(tiles) // tile_width
+    if columns:
+        grid = tiles.reshape(tile_width, tile_height, 8, 8).transpose(1, 2, 0, 3)
+    else:
+        grid = tiles.reshape(tile_height, tile_width, 8, 8).transpose(0, 2, 1, 3)
+    return grid.reshape(tile_height * 8, tile_width * 8)
+
+def pixels_to_tiles(pixels, columns=False):
+    """Cut a (height, width) image in (tiles, 8, 8) tiles."""
+    height, width = pixels.shape
+    if height % 8 or width % 8:
+        raise ValueError(f"{width}x{height} is not a multiple of 8x8 tiles")
+    grid = pixels.reshape(height // 8, 8, width // 8, 8)
+    if columns:
+        return grid.transpose(2, 0, 1, 3).reshape(-1, 8, 8)
+    return grid.transpose(0, 2, 1, 3).reshape(-1, 8, 8)
+
+def sprite_width(tile_count, width=None):
+    """Width in pixels of a sprite, square by default."""
+    if width is None:
+        side = math.isqrt(tile_count)
+        if side * side != tile_count:
+            raise ValueError(f"{tile_count} tiles don't make a square sprite, a width is needed")
+        return side * 8
+    if width % 8 or tile_count % (width // 8):
+        raise ValueError(f"{tile_count} tiles don't fit a width of {width}")
+    return width
+
+def read_2bpp(filename, width=None, columns=False):
+    """(height, width) color indices of a 2bpp file, read through mmap."""
+    if os.path.getsize(filename) % 16:
+        raise ValueError(f"{filename} is not made of 16-byte tiles")
+    data = np.memmap(filename, dtype=np.uint8, mode="r")
+    tiles = decode_tiles(data)
+    del data
+    return tiles_to_pixels(tiles, sprite_width(len(tiles), width), columns)
+
+def decode_2bpp(data, width=None, columns=False):
+    """(height, width) color indices of 2bpp bytes."""
+    if len(data) % 16:
+        raise ValueError("is not made of 16-byte tiles")
+    tiles = decode_tiles(data)
+    return tiles_to_pixels(tiles, sprite_width(len(tiles), width), columns)
+
+def write_2bpp(filename, pixels, columns=False):
+    with atomic_open(filename) as file:
+        file.write(encode_tiles(pixels_to_tiles(pixels, columns)))
+
+def pal_filename(filename):
+    return os.path.splitext(filename)[0] + ".pal"
+
+def write_pal(filename, colors, full=False):
+    """
+    Write RGB555 colors as a pokegold .pal file: the two middle
+    colors of a {white, light color, dark color, black} palette,
+    or all of them if full.
+    """
+    if not full:
+        colors = colors[1:3]
+    with atomic_open(filename) as file:
+        for r, g, b in colors:
+            file.write(f"\tRGB {r:02d}, {g:02d}, {b:02d}\n".encode())
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert 2bpp tile data to grayscale PNGs and back.")
+    parser.add_argument("-w", "--width", type=int, help="width in pixels of .2bpp sprites (default: square)")
+    parser.add_argument("-Z", "--columns", action="store_true", help="tiles in column-major order")
+    parser.add_argument("files", nargs="+")
+    args = parser.parse_args()
+    import sgbpal
+    for filename in args.files:
+        root, ext = os.path.splitext(filename)
+        try:
+            if ext.lower() == ".2bpp":
+                indices = read_2bpp(filename, args.width, args.columns)
+                with atomic_open(root + ".png") as file:
+                    sgbpal.write_indexed(file, indices, tuple(map(sgbpal.rgb5_to_rgb8, sgbpal.GRAYSCALE)))
+            elif ext.lower() == ".png":
+                with open(filename, "rb") as file:
+                    indexed = sgbpal.analyze(file.read())
+                if indexed is None:
+                    print(f"{filename} has too many colors!", file=sys.stderr)
+                else:
+                    write_2bpp(root + ".2bpp", indexed[0], args.columns)
+            else:
+                print(f"{filename} is not a .2bpp or .png file!", file=sys.stderr)
+        except ValueError as e:
+            print(f"{filename}: {e}", file=sys.stderr)
+
+if __name__ == '__main__':
+    profiling.run(main)
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Usage: python identify.py [-j jobs] [-r] [-m manifest] [-P palettes.bin] [-t game[:mode]] [-f json|csv] [-o report] path...
+
+Reverse palette lookup: find the palette table entry that
+colorized sprites were written with. The RGB555 colors of each
+sprite, read as by scan.py, are looked up in a hash index of every
+palette of the registry (see registry.py, with the palette files
+given with -P) and of their 3-color subsets, for sprites that don't
+use every color of their palette. Palettes are told apart by their
+whites too: Green (30,31,29), Red/Blue (31,29,31), Yellow
+(31,31,30)... Sprites whose white was swapped by g2rb.py or rb2g.py
+are matched without it, in a second index of the other colors.
+Classes are
+
+    exact       matched with all the colors of the sprite
+    white       matched but for the white of the sprite
+    grayscale   not colorized
+    unknown     no match
+    too-many    more colors than a palette holds
+    error       unreadable, or not remapped with -t
+
+Matches are written tool:palette_name or tool:mode:palette_name,
+as the steps of pipeline.py. The report is written as JSON or CSV
+(to stdout by default), and a count of each class is printed to
+stderr.
+
+With -t, matched sprites are colorized again in place with the
+palette of the same name of another game (and mode), e.g. -t y:gbc:
+indexed sprites only get their PLTE chunk rewritten, other ones
+are indexed with the new palette.
+"""
+
+import argparse
+import concurrent.futures
+import contextlib
+import functools
+import io
+import itertools
+import sys
+
+import numpy as np
+
+import batch
+import profiling
+import scan
+import sgbpal
+from colors import is_grayscale, luminance, rgb5_key, rgb8_to_rgb5, sort_palette
+from registry import REGISTRY, TABLES, DEFAULT_MODES
+
+CLASSES = ("exact", "white", "grayscale", "unknown", "too-many", "error")
+FIELDS = ("file", "class", "palettes", "error")
+
+def pack(colors):
+    """Hash key of a set of RGB555 colors: their sorted keys, 16 bits each."""
+    key = 0
+    for k in sorted(map(rgb5_key, colors)):
+        key = key << 16 | k + 1
+    return key
+
+@functools.lru_cache(maxsize=None)
+def load_palettes(palette_files):
+    for filename in palette_files:
+        REGISTRY.load(filename)
+
+def palette_index(palette_files=()):
+    """
+    Indexes of the palettes of the registry, with the palette files
+    loaded once: packed colors -> (game, mode, name) of the palettes
+    with those colors, and packed colors but white -> the same.
+    """
+    load_palettes(tuple(palette_files))
+    return build_index(len(REGISTRY.files))
+
+# rebuilt when palette files are loaded
+@functools.lru_cache(maxsize=None)
+def build_index(file_count):
+    exact, loose = {}, {}
+    for key, palette in REGISTRY.items():
+        for size in (4, 3):
+            for subset in itertools.combinations(palette.colors, size):
+                exact.setdefault(pack(subset), {})[key] = True
+        for size in (3, 2):
+            for subset in itertools.combinations(palette.colors[1:], size):
+                loose.setdefault(pack(subset), {})[key] = True
+    return exact, loose
+
+def lookup(colors, index):
+    """Class and matching (game, mode, name) of a set of RGB555 colors."""
+    exact, loose = index
+    matches = exact.get(pack(colors))
+    if matches:
+        return "exact", list(matches)
+    if len(colors) >= 3:
+        white = max(colors, key=luminance)
+        matches = loose.get(pack(colors - {white}))
+        if matches:
+            return "white", list(matches)
+    palette = sort_palette(colors)
+    if palette is not None and is_grayscale(palette):
+        return "grayscale", []
+    return "unknown", []
+
+def format_match(game, mode, name):
+    return ":".join(field for field in (game, mode, name) if field)
+
+def parse_target(text):
+    """(game, mode) of a -t argument, or raise ValueError."""
+    game, _, mode = text.lower().partition(":")
+    mode = mode or DEFAULT_MODES.get(game)
+    if (game, mode) not in TABLES:
+        raise ValueError(f"unknown game {game!r} or mode {mode!r}")
+    return game, mode
+
+def remap(filename, kind, colors, cls, match, target):
+    """
+    Colorize a matched sprite again in place with the palette of
+    the same name of the target (game, mode).
+    """
+    game, mode, name = match
+    palette = REGISTRY.get(game, mode, name)
+    new = REGISTRY.get(*target, name)
+    if new is None:
+        raise ValueError(f"{format_match(*target, name)} is not a palette")
+    # sprite color -> index in the palettes
+    indices = {c: i for i, c in enumerate(palette.colors) if c in colors}
+    if cls == "white":
+        indices[max(colors, key=luminance)] = 0
+    with open(filename, "rb") as file:
+        data = file.read()
+    # IHDR color type
+    if data[25:26] == b"\x03" and kind != "gif":
+        chunks = sgbpal.read_chunks(data)
+        plte = dict(chunks)[b"PLTE"]
+        entries = [tuple(plte[i:i+3]) for i in range(0, len(plte), 3)]
+        entries = [new.rgb8[indices[c]] if (c := rgb8_to_rgb5(e)) in indices else e for e in entries]
+        if kind == "apng":
+            import animation
+            tags = animation.APNG_CHUNKS
+        else:
+            tags = sgbpal.IMAGE_CHUNKS
+        output = sgbpal.with_palette([(tag, chunk) for tag, chunk in chunks if tag in tags], entries)
+    elif kind is None:
+        keys = sgbpal.rgb5_keys(sgbpal.read_rgba8(io.BytesIO(data)))
+        lut = np.zeros(32768, dtype=np.uint8)
+        for c, i in indices.items():
+            lut[rgb5_key(c)] = i
+        out = io.BytesIO()
+        sgbpal.write_indexed(out, lut[keys], new.rgb8)
+        output = out.getvalue()
+    else:
+        raise ValueError("only indexed animations can be remapped")
+    sgbpal.atomic_write(filename, output)
+
+def identify_data(data, palette_files=()):
+    """Class and matching (game, mode, name) of a sprite given as bytes."""
+    file = io.BytesIO(data)
+    kind = sgbpal.animation_format(file)
+    colors = scan.animation_colors(file, kind) if kind else scan.png_color_set(file)
+    if colors is None:
+        return "too-many", []
+    return lookup(colors, palette_index(palette_files))
+
+def identify(task):
+    """Report of a sprite: file, class, matching palettes and error."""
+    filename, target, palette_files = task
+    report = {"file": filename, "class": None, "palettes": None, "error": None}
+    error = batch.check_filename("g", filename)
+    if error:
+        report["class"], report["error"] = "error", error
+        return report
+    try:
+        if sgbpal.is_2bpp(filename):
+            report["class"] = "grayscale"
+            return report
+        with open(filename, "rb") as file:
+            kind = sgbpal.animation_format(file)
+            with profiling.stage("color set"):
+                colors = scan.animation_colors(file, kind) if kind else scan.png_color_set(file)
+        if colors is None:
+            report["class"] = "too-many"
+            return report
+        with profiling.stage("lookup"):
+            cls, matches = lookup(colors, palette_index(palette_files))
+        report["class"] = cls
+        report["palettes"] = " ".join(format_match(*match) for match in matches) or None
+        if target is not None and matches:
+            if len(matches) > 1:
+                raise ValueError("matches several palettes, not remapped")
+            with profiling.stage("remap"):
+                remap(filename, kind, colors, cls, matches[0], target)
+    except Exception as e:
+        report["class"], report["error"] = "error", str(e) or type(e).__name__
+    return report
+
+def identify_all(filenames, target=None, palette_files=(), jobs=None, chunksize=64):
+    """Reports of files, identified (and remapped to target) by a pool of jobs processes."""
+    tasks = ((filename, target, tuple(palette_files)) for filename in filenames)
+    with contextlib.ExitStack() as stack:
+        if jobs == 1:
+            yield from map(identify, tasks)
+        else:
+            executor = stack.enter_context(concurrent.futures.ProcessPoolExecutor(jobs))
+            yield from executor.map(identify, tasks, chunksize=chunksize)
+
+def main():
+    parser = argparse.ArgumentParser(description="Find the palettes colorized sprites were written with.")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--chunksize", type=int, default=64, help="files sent to a worker at once")
+    parser.add_argument("-r", "--recursive", action="store_true", help="glob directories recursively")
+    parser.add_argument("-m", "--manifest", action="append", default=[], help="file listing one path per line")
+    parser.add_argument("-P", "--palettes", action="append", default=[], help="binary palette file of registry.py")
+    parser.add_argument("-t", "--to", metavar="GAME[:MODE]", help="colorize matched sprites again for this game")
+    parser.add_argument("-f", "--format", choices=("json", "csv"), help="report format (default: from -o, or json)")
+    parser.add_argument("-o", "--output", help="report file (default: stdout)")
+    parser.add_argument("paths", nargs="*")
+    args = parser.parse_args()
+    try:
+        target = None if args.to is None else parse_target(args.to)
+    except ValueError as e:
+        parser.error(str(e))
+    paths = list(args.paths)
+    for manifest in args.manifest:
+        paths.extend(batch.read_manifest(manifest))
+    filenames = list(dict.fromkeys(batch.find_pngs(paths, args.recursive)))
+    if not filenames:
+        print("Please enter at least one valid PNG file or directory!", file=sys.stderr)
+        sys.exit(1)
+    if profiling.ENABLED:
+        args.jobs = 1
+    format = args.format
+    if format is None:
+        format = "csv" if args.output and args.output.lower().endswith(".csv") else "json"
+    reports = list(identify_all(filenames, target, args.palettes, args.jobs, args.chunksize))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8", newline="") as file:
+            scan.write_report(reports, file, format, FIELDS)
+    else:
+        scan.write_report(reports, sys.stdout, format, FIELDS)
+    counts = {name: 0 for name in CLASSES}
+    for report in reports:
+        counts[report["class"]] += 1
+    print(", ".join(f"{count} {name}" for name, count in counts.items()), file=sys.stderr)
+
+if __name__ == '__main__':
+    profiling.run(main)
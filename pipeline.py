@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Usage: python pipeline.py [-e profile] [-b bitdepth] step... -- pic.png...
+
+Chain the tools on sprites in memory: each sprite is decoded
+once with pypng, goes through every step, and is encoded once.
+Steps are g2rb and rb2g, and at most one colorizer step written
+tool:palette_name, or tool:mode:palette_name for y and gs97
+(all and auto work as in batch.py), e.g.
+
+    python pipeline.py rb:all rb2g -- pic.png
+
+writes every Red/Blue palette variant of pic.png with the white
+of Pokémon Green. Before the colorizer step, white swaps apply
+to the pixels; after it, they only rewrite the palettes of the
+variants, which share their encoded pixels.
+"""
+
+import argparse
+import sys
+
+import numpy as np
+
+import batch
+import profiling
+import sgbpal
+import whiteswap
+from colors import GREEN_WHITE, RB_WHITE
+
+SWAPS = {"g2rb": (GREEN_WHITE, RB_WHITE), "rb2g": (RB_WHITE, GREEN_WHITE)}
+
+def parse_step(text):
+    """("swap", old, new) or ("colorize", tool, args) of a step."""
+    if text in SWAPS:
+        return ("swap",) + SWAPS[text]
+    tool, *args = text.lower().split(":")
+    if tool in ("g", "rb") and len(args) == 1 or tool in ("y", "gs97") and len(args) == 2:
+        return "colorize", tool, tuple(args)
+    raise ValueError(f"unknown step {text!r}")
+
+def swap_colors(palette, old, new):
+    return tuple(new if c == old else c for c in palette)
+
+def run(filename, steps, profile="default", bitdepth=None):
+    """
+    Run parsed steps on a PNG sprite. Return False if the sprite
+    has too many colors for the colorizer step.
+    """
+    with profiling.stage("decode"), open(filename, "rb") as file:
+        pixels = np.array(sgbpal.read_rgba8(file)[..., :3])
+    variants = None
+    for step in steps:
+        if step[0] == "swap" and variants is None:
+            with profiling.stage("swap"):
+                whiteswap.swap_pixels(pixels, *step[1:])
+        elif step[0] == "swap":
+            variants = {output: swap_colors(palette, *step[1:]) for output, palette in variants.items()}
+        else:
+            with profiling.stage("quantize"):
+                keys = sgbpal.rgb5_keys(pixels)
+            with profiling.stage("color set"):
+                palette = sgbpal.sort_palette(sgbpal.color_set(keys))
+            if palette is None:
+                return False
+            with profiling.stage("index"):
+                indices = sgbpal.index_pixels(keys, palette)
+            variants = {output: sgbpal.output_palette(palette, colors)
+                        for output, colors in batch.tool_outputs(step[1], step[2], filename).items()}
+    if variants is None:
+        with profiling.stage("encode"), sgbpal.atomic_open(filename) as file:
+            sgbpal.write_rgb(file, pixels, profile)
+        return True
+    chunks, palette, used = sgbpal.indexed_chunks(None, profile, bitdepth, (indices, palette))
+    for output, colors in variants.items():
+        with profiling.stage("write"):
+            sgbpal.atomic_write(output, sgbpal.with_palette(chunks, [colors[i] for i in used]))
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description="Chain the tools on sprites in memory.")
+    parser.add_argument("-e", "--encode", choices=sgbpal.PROFILES, default="default", help="PNG encode profile")
+    parser.add_argument("-b", "--bitdepth", type=int, choices=(8, 2, 1), help="bit depth of colorized outputs")
+    parser.add_argument("steps", nargs="+")
+    argv = sys.argv[1:]
+    if "--" not in argv:
+        parser.error("the steps and the files must be separated by --")
+    split = argv.index("--")
+    args = parser.parse_args(argv[:split])
+    try:
+        steps = [parse_step(step) for step in args.steps]
+    except ValueError as e:
+        parser.error(str(e))
+    colorize = [step for step in steps if step[0] == "colorize"]
+    if len(colorize) > 1:
+        parser.error("only one colorizer step can be chained")
+    for _, tool, tool_args in colorize:
+        modes = {"y": ("sgb", "gbc", "all"), "gs97": ("normal", "shiny", "all")}.get(tool)
+        if modes is not None and tool_args[0] not in modes:
+            parser.error(f"incorrect mode {tool_args[0]!r} for {tool}")
+        if tool_args[-1] not in batch.palette_names(tool) and tool_args[-1] not in ("all", "auto"):
+            parser.error(f"incorrect palette name {tool_args[-1]!r} for {tool}")
+    for filename in argv[split + 1:]:
+        if not filename.lower().endswith(".png"):
+            print(f"{filename} is not a .png file!", file=sys.stderr)
+            continue
+        try:
+            if not run(filename, steps, args.encode, args.bitdepth):
+                print(f"{filename} has too many colors!", file=sys.stderr)
+        except ValueError as e:
+            print(f"{filename} {e}", file=sys.stderr)
+
+if __name__ == '__main__':
+    profiling.run(main)
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Importable API of the tools, working on PNG sprites in memory:
+
+    import pkmncolor
+    data = pkmncolor.colorize(data, game="y", mode="gbc", palette="bluemon")
+    data = pkmncolor.g2rb(data)
+
+Sprites are given as bytes-like objects or binary files, and the
+results are PNG bytes. Importing it only imports colors.py and
+the palette tables: NumPy, pypng and Pillow are imported on the
+first call that touches pixels. Palettes are looked up in the
+registry of registry.py.
+"""
+
+from colors import GREEN_WHITE, RB_WHITE
+from registry import REGISTRY, TABLES, DEFAULT_MODES, species_palette
+
+def load_palettes(filename):
+    """Make the palettes of a binary palette file of registry.py available."""
+    REGISTRY.load(filename)
+
+def get_palette(game, mode, palette):
+    """registry.Palette of a game, mode and palette name."""
+    if (game, mode or DEFAULT_MODES.get(game)) not in TABLES:
+        raise ValueError(f"unknown game {game!r} or mode {mode!r}")
+    found = REGISTRY.get(game, mode, palette.lower())
+    if found is None:
+        raise ValueError(f"unknown palette {palette!r}")
+    return found
+
+def read_image(image):
+    return image.read() if hasattr(image, "read") else bytes(image)
+
+def colorize(image, game=None, mode=None, palette=None, profile="default", bitdepth=None):
+    """
+    Colorize a grayscale sprite with a palette name of a game (g,
+    rb, y or gs97) and mode (sgb or gbc for y, normal or shiny for
+    gs97), or with a 4-color RGB555 palette, one of which is
+    required. Return PNG bytes, or None if the sprite has too many
+    colors.
+    """
+    import sgbpal
+    if palette is None:
+        raise ValueError("a palette name or a 4-color palette is required")
+    if isinstance(palette, str):
+        colors, colors8 = get_palette(game, mode, palette)[:2]
+    else:
+        colors, colors8 = tuple(map(tuple, palette)), None
+    return sgbpal.colorize_data(read_image(image), colors, profile, bitdepth, colors8)
+
+def identify(image):
+    """
+    Class (exact, white, grayscale, unknown or too-many, see
+    identify.py) and matching (game, mode, name) of the palettes
+    a colorized sprite was written with.
+    """
+    from identify import identify_data
+    return identify_data(read_image(image))
+
+def g2rb(image):
+    """Swap the white of a Pokémon Green sprite for the Red/Blue one, as PNG bytes."""
+    from whiteswap import swap_white_data
+    return swap_white_data(read_image(image), GREEN_WHITE, RB_WHITE)
+
+def rb2g(image):
+    """Swap the white of a Pokémon Red/Blue sprite for the Green one, as PNG bytes."""
+    from whiteswap import swap_white_data
+    return swap_white_data(read_image(image), RB_WHITE, GREEN_WHITE)
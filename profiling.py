@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Stage timings and cProfile runs of the tools.
+
+The hot paths mark their stages (decode, quantize, color set,
+index, encode...) with stage(), which only times them once
+enabled. Every script takes an opt-in --profile flag, handled
+by run(): the script then runs under cProfile, its stats are
+dumped to script.prof, and the stage timings and the functions
+with the most cumulative time are printed to stderr.
+"""
+
+import contextlib
+import os
+import sys
+import time
+
+ENABLED = False
+# stage -> [calls, seconds]
+TIMINGS = {}
+
+@contextlib.contextmanager
+def stage(name):
+    if not ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing = TIMINGS.setdefault(name, [0, 0.0])
+        timing[0] += 1
+        timing[1] += time.perf_counter() - start
+
+def enable():
+    global ENABLED
+    ENABLED = True
+    TIMINGS.clear()
+
+def format_timings(timings=None):
+    timings = TIMINGS if timings is None else timings
+    lines = [f"{'stage':<16}{'calls':>8}{'total':>12}{'per call':>12}"]
+    for name, (calls, seconds) in sorted(timings.items(), key=lambda item: -item[1][1]):
+        lines.append(f"{name:<16}{calls:>8}{seconds * 1000:>10.1f}ms{seconds / calls * 1e6:>10.1f}us")
+    return "\n".join(lines)
+
+def run(main, argv=sys.argv):
+    """Run a script's main(), profiled if --profile is in argv."""
+    if "--profile" not in argv:
+        return main()
+    argv.remove("--profile")
+    import cProfile
+    import pstats
+    enable()
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(main)
+    finally:
+        name = os.path.splitext(os.path.basename(argv[0]))[0] + ".prof"
+        profiler.dump_stats(name)
+        print(f"\nStage timings:\n{format_timings()}\n", file=sys.stderr)
+        pstats.Stats(profiler, stream=sys.stderr).sort_stats("cumulative").print_stats(20)
+        print(f"cProfile stats written to {name}", file=sys.stderr)
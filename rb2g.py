@@ -9,24 +9,16 @@ Pokémon Red/Blue sprites to those
 of Pokémon Green
 """
 
-from PIL import Image
-
 import sys
 
-def rb2g(filename):
-    img = Image.open(filename)
-    img = img.convert("RGB")
-    datas = img.getdata()
-    new_image_data = []
-    for item in datas:
-        if item[0] == 255 and item[1] == 239 and item[2] == 255:
-                new_image_data.append((247, 255, 239))
-        else:
-            new_image_data.append(item)
-    img.putdata(new_image_data)
-    img_index = img.convert("P", palette=Image.ADAPTIVE, colors=5)
-    img_index.save(filename)
-    return True
+import profiling
+from colors import GREEN_WHITE, RB_WHITE
+
+COLORS = (RB_WHITE, GREEN_WHITE)
+
+def rb2g(filename, profile="default"):
+    from whiteswap import swap_white
+    return swap_white(filename, *COLORS, profile)
 
 def main():
         if len(sys.argv) < 2:
@@ -40,4 +32,4 @@ def main():
                                 print(f"{filename}: error!", file=sys.stderr)
         		
 if __name__ == '__main__':
-	main()
+	profiling.run(main)
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Usage: python registry.py build [-a] out.bin [palettes.txt...]
+       python registry.py list [palettes.bin]
+
+Registry of every palette of the tools, indexed by (game, mode,
+name): Green (g), Red/Blue (rb), Yellow (y, sgb or gbc) and Space
+World '97 (gs97, normal or shiny). Each palette is held with its
+RGB888 values and its PLTE chunk data, computed once.
+
+User-defined palettes are loaded from binary files, mapped with
+mmap and looked up through a hash table stored in the file, so
+that loading one doesn't read its palettes. build writes such a
+file from text files of lines "game mode name r g b r g b r g b
+r g b" (RGB555, mode - for g and rb), with the built-in palettes
+too with -a.
+
+Species names are also mapped to their palette name, as in the
+MonsterPalettes table of pokered.
+"""
+
+import collections
+import importlib
+import mmap
+import os
+import re
+import struct
+import sys
+import zlib
+
+from colors import rgb5_to_rgb8, plte_bytes
+
+# (game, mode) -> module and name of its palette table
+TABLES = {("g", None): ("sgbpal_g", "palettes"),
+          ("rb", None): ("sgbpal_rb", "palettes"),
+          ("y", "sgb"): ("sgbpal_y", "palettes_sgb"),
+          ("y", "gbc"): ("sgbpal_y", "palettes_gbc"),
+          ("gs97", "normal"): ("sgbpal_gs97", "palettes"),
+          ("gs97", "shiny"): ("sgbpal_gs97", "palettes_shiny")}
+
+DEFAULT_MODES = {"gs97": "normal"}
+
+# species -> palette name, from pokered's data/pokemon/palettes.asm
+SPECIES = {
+    "bulbasaur": "greenmon", "ivysaur": "greenmon", "venusaur": "greenmon",
+    "charmander": "redmon", "charmeleon": "redmon", "charizard": "redmon",
+    "squirtle": "cyanmon", "wartortle": "cyanmon", "blastoise": "cyanmon",
+    "caterpie": "greenmon", "metapod": "greenmon", "butterfree": "cyanmon",
+    "weedle": "yellowmon", "kakuna": "yellowmon", "beedrill": "yellowmon",
+    "pidgey": "brownmon", "pidgeotto": "brownmon", "pidgeot": "brownmon",
+    "rattata": "graymon", "raticate": "graymon",
+    "spearow": "brownmon", "fearow": "brownmon",
+    "ekans": "purplemon", "arbok": "purplemon",
+    "pikachu": "yellowmon", "raichu": "yellowmon",
+    "sandshrew": "brownmon", "sandslash": "brownmon",
+    "nidoranf": "bluemon", "nidorina": "bluemon", "nidoqueen": "bluemon",
+    "nidoranm": "purplemon", "nidorino": "purplemon", "nidoking": "purplemon",
+    "clefairy": "pinkmon", "clefable": "pinkmon",
+    "vulpix": "redmon", "ninetales": "yellowmon",
+    "jigglypuff": "pinkmon", "wigglytuff": "pinkmon",
+    "zubat": "bluemon", "golbat": "bluemon",
+    "oddish": "greenmon", "gloom": "redmon", "vileplume": "redmon",
+    "paras": "redmon", "parasect": "redmon",
+    "venonat": "purplemon", "venomoth": "purplemon",
+    "diglett": "brownmon", "dugtrio": "brownmon",
+    "meowth": "yellowmon", "persian": "yellowmon",
+    "psyduck": "yellowmon", "golduck": "cyanmon",
+    "mankey": "brownmon", "primeape": "brownmon",
+    "growlithe": "brownmon", "arcanine": "redmon",
+    "poliwag": "bluemon", "poliwhirl": "bluemon", "poliwrath": "bluemon",
+    "abra": "yellowmon", "kadabra": "yellowmon", "alakazam": "yellowmon",
+    "machop": "graymon", "machoke": "graymon", "machamp": "graymon",
+    "bellsprout": "greenmon", "weepinbell": "greenmon", "victreebel": "greenmon",
+    "tentacool": "cyanmon", "tentacruel": "cyanmon",
+    "geodude": "brownmon", "graveler": "brownmon", "golem": "brownmon",
+    "ponyta": "redmon", "rapidash": "redmon",
+    "slowpoke": "pinkmon", "slowbro": "pinkmon",
+    "magnemite": "graymon", "magneton": "graymon",
+    "farfetchd": "brownmon", "doduo": "brownmon", "dodrio": "brownmon",
+    "seel": "bluemon", "dewgong": "bluemon",
+    "grimer": "purplemon", "muk": "purplemon",
+    "shellder": "graymon", "cloyster": "graymon",
+    "gastly": "purplemon", "haunter": "purplemon", "gengar": "purplemon",
+    "onix": "graymon",
+    "drowzee": "yellowmon", "hypno": "yellowmon",
+    "krabby": "redmon", "kingler": "redmon",
+    "voltorb": "yellowmon", "electrode": "yellowmon",
+    "exeggcute": "pinkmon", "exeggutor": "greenmon",
+    "cubone": "graymon", "marowak": "graymon",
+    "hitmonlee": "brownmon", "hitmonchan": "brownmon",
+    "lickitung": "pinkmon",
+    "koffing": "purplemon", "weezing": "purplemon",
+    "rhyhorn": "graymon", "rhydon": "graymon",
+    "chansey": "pinkmon", "tangela": "bluemon", "kangaskhan": "brownmon",
+    "horsea": "cyanmon", "seadra": "cyanmon",
+    "goldeen": "redmon", "seaking": "redmon",
+    "staryu": "redmon", "starmie": "graymon",
+    "mrmime": "pinkmon", "scyther": "greenmon", "jynx": "mewmon",
+    "electabuzz": "yellowmon", "magmar": "redmon", "pinsir": "brownmon",
+    "tauros": "graymon", "magikarp": "redmon", "gyarados": "bluemon",
+    "lapras": "cyanmon", "ditto": "graymon", "eevee": "graymon",
+    "vaporeon": "cyanmon", "jolteon": "yellowmon", "flareon": "redmon",
+    "porygon": "graymon",
+    "omanyte": "bluemon", "omastar": "bluemon",
+    "kabuto": "brownmon", "kabutops": "brownmon",
+    "aerodactyl": "graymon", "snorlax": "pinkmon",
+    "articuno": "bluemon", "zapdos": "yellowmon", "moltres": "redmon",
+    "dratini": "graymon", "dragonair": "bluemon", "dragonite": "brownmon",
+    "mewtwo": "mewmon", "mew": "mewmon"}
+
+Palette = collections.namedtuple("Palette", "colors rgb8 plte")
+
+def make_palette(colors):
+    """Palette of 4 RGB555 colors, with its RGB888 values and PLTE data."""
+    colors = tuple(tuple(c) for c in colors)
+    rgb8 = tuple(map(rgb5_to_rgb8, colors))
+    return Palette(colors, rgb8, plte_bytes(rgb8))
+
+def species_key(name):
+    """bulbasaur.png, Mr. Mime, NIDORAN_F -> bulbasaur, mrmime, nidoranf"""
+    return re.sub(r"[^a-z0-9]", "", os.path.splitext(os.path.basename(name))[0].lower())
+
+def species_palette(name):
+    """
+    Palette name of a species or of the filename of its sprite,
+    back sprites (pokered's bulbasaurb.png) included, or None.
+    """
+    key = species_key(name)
+    if key in SPECIES:
+        return SPECIES[key]
+    if key.endswith("b") and key[:-1] in SPECIES:
+        return SPECIES[key[:-1]]
+    return None
+
+def palette_hash(game, mode, name):
+    return zlib.crc32(f"{game}\0{mode or ''}\0{name}".encode())
+
+MAGIC = b"SGBPAL\0\1"
+# magic, palette count, slot count
+HEADER = struct.Struct("<8sII")
+# game, mode, name, RGB555 colors, RGB888 colors
+RECORD = struct.Struct("<8s8s24s12s12s")
+SLOT = struct.Struct("<I")
+
+class PaletteFile:
+    """
+    Binary palette file: a header, an open addressing hash table
+    of uint32 slots (record number + 1, 0 if empty), and records
+    of fixed size. It is mapped with mmap, and only the slots and
+    records probed by a lookup are read.
+    """
+    def __init__(self, filename):
+        with open(filename, "rb") as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, self.slot_count = HEADER.unpack_from(self.map)
+        if magic != MAGIC:
+            raise ValueError(f"{filename} is not a palette file")
+        self.records = HEADER.size + self.slot_count * SLOT.size
+
+    def slot(self, i):
+        return SLOT.unpack_from(self.map, HEADER.size + i * SLOT.size)[0]
+
+    def record(self, i):
+        """(game, mode, name) and Palette of record i."""
+        game, mode, name, rgb5, rgb8 = RECORD.unpack_from(self.map, self.records + i * RECORD.size)
+        key = (game.rstrip(b"\0").decode(), mode.rstrip(b"\0").decode() or None, name.rstrip(b"\0").decode())
+        colors = tuple(tuple(rgb5[j:j+3]) for j in range(0, 12, 3))
+        return key, Palette(colors, tuple(tuple(rgb8[j:j+3]) for j in range(0, 12, 3)), bytes(rgb8))
+
+    def get(self, game, mode, name):
+        mask = self.slot_count - 1
+        slot = palette_hash(game, mode, name) & mask
+        while record := self.slot(slot):
+            key, palette = self.record(record - 1)
+            if key == (game, mode, name):
+                return palette
+            slot = (slot + 1) & mask
+        return None
+
+    def items(self):
+        for i in range(self.count):
+            yield self.record(i)
+
+def write_palette_file(filename, palettes):
+    """Write (game, mode, name) -> RGB555 colors as a binary palette file."""
+    palettes = {key: make_palette(colors) for key, colors in palettes.items()}
+    slot_count = 1
+    while slot_count < 2 * len(palettes):
+        slot_count *= 2
+    slots = [0] * slot_count
+    records = bytearray()
+    for i, ((game, mode, name), palette) in enumerate(palettes.items()):
+        for field, size in ((game, 8), (mode or "", 8), (name, 24)):
+            if len(field.encode()) > size:
+                raise ValueError(f"{field!r} is longer than {size} bytes")
+        slot = palette_hash(game, mode, name) & (slot_count - 1)
+        while slots[slot]:
+            slot = (slot + 1) & (slot_count - 1)
+        slots[slot] = i + 1
+        records += RECORD.pack(game.encode(), (mode or "").encode(), name.encode(),
+                               bytes(v for c in palette.colors for v in c), palette.plte)
+    with open(filename, "wb") as file:
+        file.write(HEADER.pack(MAGIC, len(palettes), slot_count))
+        file.write(struct.pack(f"<{slot_count}I", *slots))
+        file.write(records)
+
+def builtin_palettes():
+    """(game, mode, name) -> RGB555 colors of the palette tables of the scripts."""
+    return {(game, mode, name): colors
+            for (game, mode), (module, table) in TABLES.items()
+            for name, colors in getattr(importlib.import_module(module), table).items()}
+
+class Registry:
+    """
+    Palettes by (game, mode, name): the built-in ones, computed on
+    first use, and the ones of the loaded palette files, which come
+    first.
+    """
+    def __init__(self):
+        self.files = []
+        self.builtin = None
+
+    def load(self, filename):
+        self.files.insert(0, PaletteFile(filename))
+
+    def builtins(self):
+        if self.builtin is None:
+            self.builtin = {key: make_palette(colors) for key, colors in builtin_palettes().items()}
+        return self.builtin
+
+    def get(self, game, mode, name):
+        """Palette of a game, mode and name, or None."""
+        mode = mode or DEFAULT_MODES.get(game)
+        for palette_file in self.files:
+            palette = palette_file.get(game, mode, name)
+            if palette is not None:
+                return palette
+        return self.builtins().get((game, mode, name))
+
+    def items(self):
+        """(game, mode, name) and Palette of every palette, the ones of the palette files first."""
+        palettes = dict(self.builtins())
+        for palette_file in reversed(self.files):
+            palettes.update(palette_file.items())
+        return palettes.items()
+
+    def names(self, game, mode=None):
+        mode = mode or DEFAULT_MODES.get(game)
+        names = {}
+        for key in self.builtins():
+            if key[:2] == (game, mode):
+                names[key[2]] = True
+        for palette_file in reversed(self.files):
+            for key, palette in palette_file.items():
+                if key[:2] == (game, mode):
+                    names[key[2]] = True
+        return list(names)
+
+REGISTRY = Registry()
+
+def read_palette_text(filename):
+    """(game, mode, name) -> RGB555 colors of a text palette file."""
+    palettes = {}
+    with open(filename, encoding="utf-8") as file:
+        for n, line in enumerate(file, 1):
+            fields = line.split("#")[0].split()
+            if not fields:
+                continue
+            if len(fields) != 15 or not all(f.isdigit() and int(f) < 32 for f in fields[3:]):
+                raise ValueError(f"{filename}:{n}: expected game mode name and 12 RGB555 values")
+            values = [int(f) for f in fields[3:]]
+            mode = None if fields[1] == "-" else fields[1]
+            palettes[fields[0], mode, fields[2].lower()] = tuple(zip(values[0::3], values[1::3], values[2::3]))
+    return palettes
+
+def main():
+    # not imported with the module, which pkmncolor.py imports
+    import argparse
+    parser = argparse.ArgumentParser(description="Build or list binary palette files.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build")
+    build.add_argument("-a", "--all", action="store_true", help="include the built-in palettes")
+    build.add_argument("output")
+    build.add_argument("texts", nargs="*")
+    listing = commands.add_parser("list")
+    listing.add_argument("file", nargs="?")
+    args = parser.parse_args()
+    if args.command == "build":
+        palettes = builtin_palettes() if args.all else {}
+        try:
+            for text in args.texts:
+                palettes.update(read_palette_text(text))
+            write_palette_file(args.output, palettes)
+        except ValueError as e:
+            print(e, file=sys.stderr)
+            sys.exit(1)
+        print(f"{len(palettes)} palettes written to {args.output}", file=sys.stderr)
+    else:
+        items = PaletteFile(args.file).items() if args.file else REGISTRY.builtins().items()
+        for (game, mode, name), palette in items:
+            print(f"{game} {mode or '-'} {name}: " + ", ".join(map(str, palette.rgb8)))
+
+if __name__ == '__main__':
+    main()
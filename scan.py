@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Usage: python scan.py [-j jobs] [-r] [-m manifest] [-f json|csv] [-o report] path...
+
+Read-only pre-scan of sprites before a batch.py run: classify
+what the colorizers will do with each file, without writing
+anything. Paths are globbed as in batch.py. Classes are
+
+    grayscale   already grayscale, colorized with the palette
+    one-color   a single color besides black and white, which
+                gets its inverse as second color
+    colored     two colors besides black and white, kept as
+                they are
+    too-many    rejected for too many colors
+    error       unreadable
+
+Sprites already indexed with the grayscale palette are classified
+from their chunks up to PLTE. Other PNGs are decoded in their own
+format, without conversion to RGBA, and only until more than 4
+RGB555 colors have been seen: indexed rows only mark the palette
+entries they use. Animated APNG and GIF sprites are classified from
+the colors of all their frames, see animation.py.
+The report is written as JSON or CSV (to stdout by default), and
+a count of each class is printed to stderr.
+"""
+
+import argparse
+import concurrent.futures
+import contextlib
+import csv
+import json
+import os
+import sys
+
+import numpy as np
+import png
+
+import batch
+import profiling
+import sgbpal
+from colors import B_AND_W, is_grayscale, key_rgb5, rgb8_to_rgb5, rgb5_key, sort_palette
+
+# rows quantized at once
+BLOCK = 64
+
+CLASSES = ("grayscale", "one-color", "colored", "too-many", "error")
+FIELDS = ("file", "class", "colors", "error")
+
+def classify_colors(colors):
+    """Class of a sprite of a set of RGB555 colors (None for too many)."""
+    palette = None if colors is None else sort_palette(colors)
+    if palette is None:
+        return "too-many"
+    if is_grayscale(palette):
+        return "grayscale"
+    return "one-color" if len(colors - B_AND_W) == 1 else "colored"
+
+def row_blocks(rows, width, planes):
+    """(rows, width, planes) uint8 arrays of BLOCK rows at a time."""
+    buf = bytearray()
+    count = 0
+    for row in rows:
+        buf += row
+        count += 1
+        if count == BLOCK:
+            yield np.frombuffer(buf, dtype=np.uint8).reshape(count, width, planes)
+            buf, count = bytearray(), 0
+    if count:
+        yield np.frombuffer(buf, dtype=np.uint8).reshape(count, width, planes)
+
+def png_color_set(file):
+    """
+    Distinct RGB555 colors of a PNG file, or None as soon as there
+    are more colors than a palette can hold. Rows are read in their
+    own format: indexed ones only mark the palette entries used, and
+    8-bit ones are quantized BLOCK rows at a time.
+    """
+    width, height, rows, info = png.Reader(file).read()
+    palette = info.get("palette")
+    planes = info["planes"]
+    if palette is None and info["bitdepth"] != 8:
+        # as the colorizers decode them
+        file.seek(0)
+        width, height, rows = sgbpal.rgba8_rows(file)
+        planes = 4
+    if palette is not None:
+        keys = np.array([rgb5_key(rgb8_to_rgb5(c[:3])) for c in palette], dtype=np.uint16)
+        used = np.zeros(256, dtype=bool)
+        for y, row in enumerate(rows):
+            used[row] = True
+            if y % BLOCK == BLOCK - 1 and len(set(keys[used[:len(keys)]].tolist())) > 4:
+                return None
+        present = set(keys[used[:len(keys)]].tolist())
+    else:
+        # gray planes as RGB, alpha ignored
+        channels = [0, 1, 2] if planes >= 3 else [0, 0, 0]
+        found = np.zeros(32768, dtype=bool)
+        for block in row_blocks(rows, width, planes):
+            found[sgbpal.rgb5_keys(block[..., channels])] = True
+            if np.count_nonzero(found) > 4:
+                return None
+        present = np.flatnonzero(found).tolist()
+    if len(present) > 4:
+        return None
+    return {key_rgb5(k) for k in present}
+
+def animation_colors(file, kind):
+    """Distinct RGB555 colors of every frame of an animated sprite, or None for too many."""
+    import animation
+    return animation.color_set(file, kind)
+
+def scan(filename):
+    """Report of a sprite: file, class, number of colors and error."""
+    report = {"file": filename, "class": None, "colors": None, "error": None}
+    error = batch.check_filename("g", filename)
+    if error:
+        report["class"], report["error"] = "error", error
+        return report
+    try:
+        if sgbpal.is_2bpp(filename):
+            if os.path.getsize(filename) % 16:
+                raise ValueError("is not made of 16-byte tiles")
+            report["class"] = "grayscale"
+            return report
+        with open(filename, "rb") as file:
+            kind = sgbpal.animation_format(file)
+            if kind is not None:
+                with profiling.stage("color set"):
+                    colors = animation_colors(file, kind)
+            elif sgbpal.grayscale_bitdepth(file) is not None:
+                report["class"] = "grayscale"
+                return report
+            else:
+                file.seek(0)
+                with profiling.stage("color set"):
+                    colors = png_color_set(file)
+    except Exception as e:
+        report["class"], report["error"] = "error", str(e) or type(e).__name__
+        return report
+    report["class"] = classify_colors(colors)
+    if colors is not None:
+        report["colors"] = len(colors)
+    return report
+
+def scan_all(filenames, jobs=None, chunksize=64):
+    """Reports of files, scanned by a pool of jobs processes."""
+    with contextlib.ExitStack() as stack:
+        if jobs == 1:
+            yield from map(scan, filenames)
+        else:
+            executor = stack.enter_context(concurrent.futures.ProcessPoolExecutor(jobs))
+            yield from executor.map(scan, filenames, chunksize=chunksize)
+
+def write_report(reports, file, format="json", fields=FIELDS):
+    if format == "csv":
+        writer = csv.DictWriter(file, fields, lineterminator="\n")
+        writer.writeheader()
+        writer.writerows(reports)
+    else:
+        json.dump(reports, file, indent=1)
+        file.write("\n")
+
+def main():
+    parser = argparse.ArgumentParser(description="Classify sprites before a batch run, without writing them.")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--chunksize", type=int, default=64, help="files sent to a worker at once")
+    parser.add_argument("-r", "--recursive", action="store_true", help="glob directories recursively")
+    parser.add_argument("-m", "--manifest", action="append", default=[], help="file listing one path per line")
+    parser.add_argument("-f", "--format", choices=("json", "csv"), help="report format (default: from -o, or json)")
+    parser.add_argument("-o", "--output", help="report file (default: stdout)")
+    parser.add_argument("paths", nargs="*")
+    args = parser.parse_args()
+    paths = list(args.paths)
+    for manifest in args.manifest:
+        paths.extend(batch.read_manifest(manifest))
+    filenames = list(dict.fromkeys(batch.find_pngs(paths, args.recursive)))
+    if not filenames:
+        print("Please enter at least one valid PNG file or directory!", file=sys.stderr)
+        sys.exit(1)
+    if profiling.ENABLED:
+        args.jobs = 1
+    format = args.format
+    if format is None:
+        format = "csv" if args.output and args.output.lower().endswith(".csv") else "json"
+    reports = list(scan_all(filenames, args.jobs, args.chunksize))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8", newline="") as file:
+            write_report(reports, file, format)
+    else:
+        write_report(reports, sys.stdout, format)
+    counts = {name: 0 for name in CLASSES}
+    for report in reports:
+        counts[report["class"]] += 1
+    print(", ".join(f"{count} {name}" for name, count in counts.items()), file=sys.stderr)
+
+if __name__ == '__main__':
+    profiling.run(main)
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Usage: python server.py [-p port | -u socket] [-j jobs] [-P palettes.bin]
+
+Long-running colorize server, for previewers that would otherwise
+run one of the sgbpal_* scripts per sprite. It speaks HTTP/1.1
+with keep-alive on localhost (or on a Unix socket with -u):
+
+    POST /colorize?game=y&mode=gbc&palette=bluemon[&profile=fast][&bitdepth=2]
+
+with the PNG bytes of a sprite as body, answers with the PNG bytes
+of the colorized sprite. Games are g, rb, y (mode sgb or gbc) and
+gs97 (mode normal or shiny). Nothing is written to disk, and the
+palettes come from the registry of registry.py, with the ones
+of the binary palette files given with -P.
+Sprites are colorized in the event loop, or in a pool of jobs
+processes with -j.
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import functools
+import sys
+import urllib.parse
+
+import pkmncolor
+import profiling
+import sgbpal
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large", 422: "Unprocessable Entity", 500: "Internal Server Error"}
+
+MAX_BODY = 16 * 1024 * 1024
+
+def parse_query(query):
+    """Palette, encode profile and bit depth of a query, or raise ValueError."""
+    params = dict(urllib.parse.parse_qsl(query))
+    palette = pkmncolor.get_palette(params.get("game"), params.get("mode"), params.get("palette", ""))
+    profile = params.get("profile", "default")
+    if profile not in sgbpal.PROFILES:
+        raise ValueError("unknown encode profile")
+    bitdepth = params.get("bitdepth")
+    if bitdepth is not None:
+        if bitdepth not in ("8", "2", "1"):
+            raise ValueError("bit depth must be 8, 2 or 1")
+        bitdepth = int(bitdepth)
+    return palette, profile, bitdepth
+
+class Server:
+    def __init__(self, jobs=None):
+        self.executor = None if jobs is None else concurrent.futures.ProcessPoolExecutor(jobs)
+
+    async def colorize(self, data, palette, profile, bitdepth):
+        colors, colors8 = palette[:2]
+        if self.executor is None:
+            return sgbpal.colorize_data(data, colors, profile, bitdepth, colors8)
+        call = functools.partial(sgbpal.colorize_data, data, colors, profile, bitdepth, colors8)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, call)
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+
+    async def respond(self, method, target, body):
+        """Status, content type and body of the response to a request."""
+        path, _, query = target.partition("?")
+        if path != "/colorize":
+            return 404, "text/plain", b"not found\n"
+        if method != "POST":
+            return 405, "text/plain", b"use POST\n"
+        try:
+            palette, profile, bitdepth = parse_query(query)
+        except ValueError as e:
+            return 400, "text/plain", f"{e}\n".encode()
+        try:
+            output = await self.colorize(body, palette, profile, bitdepth)
+        except Exception as e:
+            return 400, "text/plain", f"{str(e) or type(e).__name__}\n".encode()
+        if output is None:
+            return 422, "text/plain", b"has too many colors!\n"
+        return 200, "image/png", output
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, version = request_line.decode("latin-1").split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                if length > MAX_BODY:
+                    status, content_type, body = 413, "text/plain", b"sprite too big\n"
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(length)
+                    status, content_type, body = await self.respond(method, target, body)
+                    keep_alive = (headers.get("connection", "").lower() != "close" and version == "HTTP/1.1")
+                writer.write(f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                             f"Content-Type: {content_type}\r\n"
+                             f"Content-Length: {len(body)}\r\n"
+                             f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ValueError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+async def serve(server, host="127.0.0.1", port=8097, unix=None):
+    if unix is not None:
+        listener = await asyncio.start_unix_server(server.handle, unix)
+        where = unix
+    else:
+        listener = await asyncio.start_server(server.handle, host, port)
+        where = f"http://{host}:{port}"
+    print(f"Serving on {where}", file=sys.stderr, flush=True)
+    async with listener:
+        await listener.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description="Long-running colorize server.")
+    parser.add_argument("-p", "--port", type=int, default=8097, help="localhost port (default: 8097)")
+    parser.add_argument("-u", "--unix", metavar="SOCKET", help="listen on a Unix socket instead")
+    parser.add_argument("-j", "--jobs", type=int, help="colorize in a pool of processes")
+    parser.add_argument("-P", "--palettes", action="append", default=[], help="binary palette file of registry.py")
+    args = parser.parse_args()
+    for filename in args.palettes:
+        pkmncolor.load_palettes(filename)
+    server = Server(args.jobs)
+    try:
+        asyncio.run(serve(server, port=args.port, unix=args.unix))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+if __name__ == '__main__':
+    profiling.run(main)
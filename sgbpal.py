@@ -0,0 +1,559 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Shared colorization engine of the sgbpal_* scripts.
+
+The pixels are handled as NumPy arrays: RGB888 colors are
+quantized to RGB555 keys (r << 10 | g << 5 | b), the color set
+is read from a histogram of those keys, and pixels are mapped
+to palette indices through a 32768-entry lookup table.
+
+Sprites that are already indexed with the grayscale palette
+only get their PLTE chunk rewritten, their IDAT chunks are
+copied through untouched. In the same way, every palette
+variant of a sprite shares the IDAT chunks encoded once.
+
+The encode profiles trade output size for speed: fast uses
+zlib level 1, default level 9, and archival keeps the smallest
+result of every PNG filter strategy. Indices may be packed in
+2-bit (or 1-bit) scanlines instead of 8-bit ones.
+
+Sprites too big to be held in memory can be streamed one row
+at a time instead, see colorize_stream().
+
+Sprite sheets can be colorized cell by cell with a palette
+per cell in one pass, see colorize_sheet().
+
+Sprites can also be read from and written to Game Boy 2bpp
+tile data, see gbgfx.py, and animated APNG and GIF sprites are
+colorized frame by frame with a shared palette, see animation.py.
+"""
+
+import io
+import os
+import struct
+import zlib
+
+import numpy as np
+import png
+
+import gbgfx
+from colors import (B_AND_W, GRAYSCALE, rgb8_to_rgb5, rgb5_to_rgb8, invert, luminance, is_grayscale,
+                    rgb5_key, key_rgb5, plte_bytes, sort_palette, output_colors, output_palette,
+                    atomic_open, atomic_write)
+from profiling import stage
+
+IMAGE_CHUNKS = (b"IHDR", b"PLTE", b"IDAT", b"IEND")
+
+def rgba8_rows(file):
+    """Width, height and RGBA8 rows of a PNG file as bytes-like objects, decoded one at a time."""
+    width, height, rows = png.Reader(file).asRGBA8()[:3]
+    # pypng gives lists for bit depths other than 8
+    return width, height, (bytes(row) if isinstance(row, list) else row for row in rows)
+
+def read_chunks(data):
+    return list(png.Reader(bytes=data).chunks())
+
+def write_chunks(chunks):
+    out = io.BytesIO()
+    png.write_chunks(out, chunks)
+    return out.getvalue()
+
+def grayscale_chunks(data):
+    """
+    Chunks of a PNG already indexed with the grayscale palette,
+    or None for other PNGs. Only PLTE entries that quantize to
+    {white, 21, 10, black} are accepted: any subset of them
+    colorizes with the same indices.
+    """
+    # IHDR color type
+    if data[25:26] != b"\x03":
+        return None
+    chunks = read_chunks(data)
+    if not is_grayscale_plte(dict(chunks).get(b"PLTE")):
+        return None
+    return [(tag, chunk) for tag, chunk in chunks if tag in IMAGE_CHUNKS]
+
+def is_grayscale_plte(plte):
+    return (plte is not None and len(plte) == 12 and
+        tuple(rgb8_to_rgb5(plte[i:i+3]) for i in range(0, 12, 3)) == GRAYSCALE)
+
+def with_palette(chunks, palette):
+    """PNG bytes of indexed chunks with their PLTE chunk replaced."""
+    plte = plte_bytes(palette)
+    return write_chunks([(tag, plte if tag == b"PLTE" else chunk)
+                         for tag, chunk in chunks])
+
+def animation_format(file):
+    """
+    apng or gif for an animated sprite, None for a still one. Only
+    the chunk headers up to the first IDAT of PNGs are read, and the
+    position of the file is kept.
+    """
+    start = file.tell()
+    try:
+        head = file.read(8)
+        if head[:4] == b"GIF8":
+            return "gif"
+        if head != png.signature:
+            return None
+        while len(header := file.read(8)) == 8:
+            length, tag = struct.unpack(">I4s", header)
+            if tag == b"acTL":
+                return "apng"
+            if tag in (b"IDAT", b"IEND"):
+                return None
+            # data and CRC
+            file.seek(length + 4, io.SEEK_CUR)
+        return None
+    finally:
+        file.seek(start)
+
+def read_rgba8(file):
+    """Decode a PNG file to a (height, width, 4) uint8 array."""
+    width, height, rows = rgba8_rows(file)
+    buf = bytearray()
+    for row in rows:
+        buf += row
+    return np.frombuffer(buf, dtype=np.uint8).reshape(height, width, 4)
+
+def rgb5_keys(pixels):
+    """Quantize RGBA8 pixels to RGB555 keys, ignoring alpha."""
+    rgb = pixels[..., :3] >> 3
+    keys = rgb[..., 0].astype(np.uint16) << 10
+    keys |= rgb[..., 1].astype(np.uint16) << 5
+    keys |= rgb[..., 2]
+    return keys
+
+def color_set(keys):
+    """Distinct RGB555 colors of an array of keys."""
+    present = np.bincount(keys.ravel(), minlength=32768)
+    return {key_rgb5(int(k)) for k in np.flatnonzero(present)}
+
+def index_lut(palette):
+    lut = np.zeros(32768, dtype=np.uint8)
+    for i, c in enumerate(palette):
+        lut[rgb5_key(c)] = i
+    return lut
+
+def index_pixels(keys, palette):
+    """Map RGB555 keys to their index in the palette."""
+    return index_lut(palette)[keys]
+
+def filter_scanlines(scanlines, filter_type):
+    """
+    Apply a PNG filter type to every row of a (height, width)
+    uint8 array of scanlines, with 1 byte per pixel.
+    """
+    x = scanlines.astype(np.int16)
+    a = np.zeros_like(x)
+    a[:, 1:] = x[:, :-1]
+    b = np.zeros_like(x)
+    b[1:] = x[:-1]
+    if filter_type == 0:
+        predictor = 0
+    elif filter_type == 1:
+        predictor = a
+    elif filter_type == 2:
+        predictor = b
+    elif filter_type == 3:
+        predictor = (a + b) // 2
+    elif filter_type == 4:
+        c = np.zeros_like(x)
+        c[1:, 1:] = x[:-1, :-1]
+        p = a + b - c
+        pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+        predictor = np.where((pa <= pb) & (pa <= pc), a, np.where(pb <= pc, b, c))
+    return ((x - predictor) & 0xFF).astype(np.uint8)
+
+def filtered_streams(scanlines):
+    """
+    Filtered image data for every filter type used on all rows,
+    and for the filter type of each row with the minimum sum of
+    absolute differences, as recommended by the PNG specification.
+    """
+    height = scanlines.shape[0]
+    filtered = [filter_scanlines(scanlines, t) for t in range(5)]
+    costs = np.stack([abs(f.view(np.int8).astype(np.int32)).sum(axis=1) for f in filtered])
+    best = costs.argmin(axis=0)
+    filtered.append(np.stack(filtered)[best, np.arange(height)])
+    for types, f in zip([np.full(height, t) for t in range(5)] + [best], filtered):
+        yield np.hstack([types.astype(np.uint8)[:, None], f]).tobytes()
+
+def smallest_idat(scanlines):
+    """
+    Smallest zlib stream of the scanlines among every filter
+    strategy and several zlib strategies, or zopfli if installed.
+    """
+    try:
+        import zopfli.zlib
+    except ImportError:
+        zopfli = None
+    best = None
+    for stream in filtered_streams(scanlines):
+        candidates = []
+        for strategy in (zlib.Z_DEFAULT_STRATEGY, zlib.Z_FILTERED):
+            compressor = zlib.compressobj(9, zlib.DEFLATED, 15, 9, strategy)
+            candidates.append(compressor.compress(stream) + compressor.flush())
+        if zopfli is not None:
+            candidates.append(zopfli.zlib.compress(stream))
+        for idat in candidates:
+            if best is None or len(idat) < len(best):
+                best = idat
+    return best
+
+# zlib level of the encode profiles, None for the archival search
+PROFILES = {"fast": 1, "default": 9, "archival": None}
+
+def pack_scanlines(indices, bitdepth):
+    """Pack rows of indices below 2**bitdepth into scanlines of that bit depth."""
+    if bitdepth == 8:
+        return indices
+    height, width = indices.shape
+    per_byte = 8 // bitdepth
+    pixels = np.zeros((height, -(-width // per_byte) * per_byte), dtype=np.uint8)
+    pixels[:, :width] = indices
+    shifts = np.arange(8 - bitdepth, -1, -bitdepth, dtype=np.uint8)
+    return np.bitwise_or.reduce(pixels.reshape(height, -1, per_byte) << shifts, axis=2)
+
+def write_indexed(file, indices, palette, profile="default", bitdepth=8):
+    height, width = indices.shape
+    level = PROFILES[profile]
+    scanlines = pack_scanlines(indices, bitdepth)
+    writer = png.Writer(width, height, palette=palette, bitdepth=bitdepth, compression=level)
+    if level is not None:
+        writer.write_packed(file, scanlines)
+        return
+    writer.write_preamble(file)
+    png.write_chunk(file, b"IDAT", smallest_idat(scanlines))
+    png.write_chunk(file, b"IEND")
+
+def analyze(data):
+    """
+    Indices of a PNG sprite in its sorted palette, and that
+    palette, or None if the sprite has too many colors.
+    """
+    with stage("decode"):
+        pixels = read_rgba8(io.BytesIO(data))
+    with stage("quantize"):
+        keys = rgb5_keys(pixels)
+    with stage("color set"):
+        palette = sort_palette(color_set(keys))
+    if palette is None:
+        return None
+    with stage("index"):
+        return index_pixels(keys, palette), palette
+
+def indexed_chunks(data, profile="default", bitdepth=None, indexed=None):
+    """
+    Chunks of a sprite indexed with its sorted palette, that
+    palette, and the indices in it of the written PLTE entries,
+    or None if the sprite has too many colors. Sprites already
+    indexed in grayscale with the same bit depth are not decoded,
+    and sprites already analyzed are given as indexed.
+
+    The bit depth defaults to 8, or to the one of sprites already
+    indexed. A bit depth of 1 falls back to 2 for sprites using
+    more than two colors of their palette.
+    """
+    if indexed is None:
+        with stage("grayscale check"):
+            chunks = grayscale_chunks(data)
+        # IHDR bit depth
+        if chunks is not None and bitdepth in (None, chunks[0][1][8]):
+            return chunks, GRAYSCALE, (0, 1, 2, 3)
+        indexed = analyze(data)
+        if indexed is None:
+            return None
+    indices, palette = indexed
+    used = (0, 1, 2, 3)
+    if bitdepth is None:
+        bitdepth = 8
+    elif bitdepth == 1:
+        used = tuple(int(i) for i in np.flatnonzero(np.bincount(indices.ravel(), minlength=4)))
+        if len(used) > 2:
+            bitdepth = 2
+            used = (0, 1, 2, 3)
+        else:
+            lut = np.zeros(4, dtype=np.uint8)
+            lut[list(used)] = range(len(used))
+            indices = lut[indices]
+    with stage("encode"):
+        out = io.BytesIO()
+        write_indexed(out, indices, [rgb5_to_rgb8(palette[i]) for i in used], profile, bitdepth)
+        return read_chunks(out.getvalue()), palette, used
+
+def sheet_cells(shape, cell_width, cell_height):
+    """Number of the cell of every pixel of a sheet, in reading order."""
+    height, width = shape
+    if height % cell_height or width % cell_width:
+        raise ValueError(f"{width}x{height} is not a multiple of {cell_width}x{cell_height} cells")
+    rows = np.arange(height) // cell_height * (width // cell_width)
+    return rows[:, None] + np.arange(width) // cell_width
+
+def analyze_cells(keys, cells):
+    """
+    Indices of the pixels of a sheet in the sorted palette of
+    their cell, and the palettes of the cells, None for cells
+    with too many colors. The colors of every cell are read at
+    once from the distinct (cell, RGB555 key) pairs.
+    """
+    pairs, inverse = np.unique(cells.astype(np.int64) << 15 | keys, return_inverse=True)
+    pair_keys = pairs & 0x7FFF
+    bounds = np.searchsorted(pairs >> 15, np.arange(cells.max() + 2))
+    pair_indices = np.zeros(len(pairs), dtype=np.uint8)
+    palettes = []
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        palette = None
+        if end - start <= 4:
+            palette = sort_palette(key_rgb5(int(k)) for k in pair_keys[start:end])
+        if palette is not None:
+            pair_indices[start:end] = index_lut(palette)[pair_keys[start:end]]
+        palettes.append(palette)
+    return pair_indices[inverse].reshape(keys.shape), palettes
+
+def write_rgb(file, pixels, profile="default"):
+    """
+    Write a (height, width, 3) array of RGB888 pixels, indexed
+    if they have at most 256 colors. The archival search only
+    applies to indexed images, RGB ones use zlib level 9.
+    """
+    height, width = pixels.shape[:2]
+    rgb = pixels.astype(np.uint32)
+    colors, inverse = np.unique(rgb[..., 0] << 16 | rgb[..., 1] << 8 | rgb[..., 2], return_inverse=True)
+    if len(colors) <= 256:
+        palette = [(int(c) >> 16, int(c) >> 8 & 0xFF, int(c) & 0xFF) for c in colors]
+        write_indexed(file, inverse.reshape(height, width).astype(np.uint8), palette, profile)
+        return
+    level = PROFILES[profile]
+    writer = png.Writer(width, height, greyscale=False, compression=9 if level is None else level)
+    writer.write_packed(file, pixels.reshape(height, -1))
+
+def colorize_sheet(filename, cell_width, cell_height, cells, output=None, profile="default"):
+    """
+    Colorize every cell of a sprite sheet with its 4-color RGB555
+    palette in cells, in reading order, and write the sheet to
+    output (in place by default). Cells without a palette, or
+    mapped to None, keep their colors. The sheet is decoded and
+    encoded once, the cells are analyzed with array operations.
+    Return the numbers of the cells with too many colors, which
+    are left as they are.
+    """
+    with open(filename, "rb") as file:
+        pixels = read_rgba8(file)
+    keys = rgb5_keys(pixels)
+    grid = sheet_cells(keys.shape, cell_width, cell_height)
+    indices, palettes = analyze_cells(keys, grid)
+    if len(cells) > len(palettes):
+        raise ValueError(f"{len(cells)} palettes for {len(palettes)} cells")
+    cells = list(cells) + [None] * (len(palettes) - len(cells))
+    bad = [n for n, palette in enumerate(palettes) if palette is None]
+    table = np.zeros((len(palettes), 4, 3), dtype=np.uint8)
+    for n, (palette, colors) in enumerate(zip(palettes, cells)):
+        if palette is not None and colors is not None:
+            table[n] = output_palette(palette, colors)
+    out = table[grid, indices]
+    # copied as they are, not rounded to RGB555
+    kept = [n for n, colors in enumerate(cells) if colors is None or palettes[n] is None]
+    if kept:
+        mask = np.isin(grid, kept)
+        out[mask] = pixels[..., :3][mask]
+    with atomic_open(filename if output is None else output) as file:
+        write_rgb(file, out, profile)
+    return bad
+
+def colorize_all_data(data, outputs, profile="default", bitdepth=None, indexed=None):
+    """
+    colorize_all() in memory, on PNG bytes or on an indexed sprite:
+    output filename -> PNG bytes, or None if the sprite has too
+    many colors.
+    """
+    kind = None if data is None else animation_format(io.BytesIO(data))
+    if kind is not None:
+        import animation
+        return animation.colorize_all_data(data, kind, outputs, profile, bitdepth)
+    encoded = indexed_chunks(data, profile, bitdepth, indexed)
+    if encoded is None:
+        return None
+    chunks, palette, used = encoded
+    results = {}
+    for output, colors in outputs.items():
+        colors8 = output_palette(palette, colors)
+        results[output] = with_palette(chunks, [colors8[i] for i in used])
+    return results
+
+def colorize_data(data, colors, profile="default", bitdepth=None, colors8=None):
+    """
+    PNG bytes of a PNG sprite colorized in memory with a 4-color
+    RGB555 palette, whose RGB888 values may be given precomputed
+    as colors8, or None if the sprite has too many colors.
+    Animated sprites are colorized as such.
+    """
+    if animation_format(io.BytesIO(data)) is not None:
+        outputs = colorize_all_data(data, {None: colors}, profile, bitdepth)
+        return None if outputs is None else outputs[None]
+    encoded = indexed_chunks(data, profile, bitdepth)
+    if encoded is None:
+        return None
+    chunks, palette, used = encoded
+    if colors8 is None or not is_grayscale(palette):
+        colors8 = output_palette(palette, colors)
+    return with_palette(chunks, [colors8[i] for i in used])
+
+def is_2bpp(filename):
+    return filename.lower().endswith(".2bpp")
+
+def variant_filename(filename, *parts):
+    """pic.png -> pic_part1_part2.png"""
+    root, ext = os.path.splitext(filename)
+    return "_".join((root,) + parts) + ext
+
+def colorize(filename, colors, profile="default", bitdepth=None, width=None, columns=False):
+    """
+    Colorize a grayscale sprite in place with a
+    4-color RGB555 palette. Return False if the
+    sprite has too many colors.
+    """
+    return colorize_all(filename, {filename: colors}, profile, bitdepth, width, columns)
+
+def colorize_all(filename, outputs, profile="default", bitdepth=None, width=None, columns=False):
+    """
+    Colorize a grayscale sprite once for every output
+    filename -> 4-color RGB555 palette of outputs.
+    The sprite is decoded and encoded only once, the
+    outputs only differ by their PLTE chunk.
+
+    Sprites and outputs may be PNG files or 2bpp tile data,
+    in rows of tiles of width pixels (square by default) or
+    in columns. 2bpp outputs get their palette as a .pal file.
+    """
+    if is_2bpp(filename):
+        data = None
+        indexed = gbgfx.read_2bpp(filename, width, columns), GRAYSCALE
+    else:
+        with stage("read"), open(filename, "rb") as file:
+            data = file.read()
+        kind = animation_format(io.BytesIO(data))
+        if kind is not None:
+            import animation
+            return animation.colorize_all(io.BytesIO(data), kind, outputs, profile, bitdepth)
+        indexed = None
+        if any(map(is_2bpp, outputs)):
+            indexed = analyze(data)
+            if indexed is None:
+                return False
+    if not all(map(is_2bpp, outputs)):
+        encoded = indexed_chunks(data, profile, bitdepth, indexed)
+        if encoded is None:
+            return False
+        chunks, palette, used = encoded
+    for output, colors in outputs.items():
+        if is_2bpp(output):
+            gbgfx.write_2bpp(output, indexed[0], columns)
+            gbgfx.write_pal(gbgfx.pal_filename(output), output_colors(indexed[1], colors))
+        else:
+            colors = output_palette(palette, colors)
+            with stage("write"):
+                atomic_write(output, with_palette(chunks, [colors[i] for i in used]))
+    return True
+
+def stream_rgba8(file):
+    """Width, height and (width, 4) uint8 rows of a PNG file, decoded one at a time."""
+    width, height, rows = rgba8_rows(file)
+    return width, height, (np.frombuffer(row, dtype=np.uint8).reshape(width, 4) for row in rows)
+
+def stream_color_set(rows):
+    """
+    Distinct RGB555 colors of rows of RGBA8 pixels, or None as
+    soon as there are more colors than a palette can hold.
+    """
+    present = np.zeros(32768, dtype=bool)
+    for y, row in enumerate(rows):
+        present[rgb5_keys(row)] = True
+        if y % 64 == 63 and np.count_nonzero(present) > 4:
+            return None
+    if np.count_nonzero(present) > 4:
+        return None
+    return {key_rgb5(int(k)) for k in np.flatnonzero(present)}
+
+def grayscale_bitdepth(file):
+    """
+    Bit depth of a PNG file already indexed with the grayscale
+    palette, or None for other PNGs. Only the chunks up to PLTE
+    are read.
+    """
+    header = None
+    for tag, chunk in png.Reader(file).chunks():
+        if tag == b"IHDR":
+            header = chunk
+            # color type
+            if header[9] != 3:
+                return None
+        elif tag in (b"PLTE", b"IDAT", b"IEND"):
+            return header[8] if tag == b"PLTE" and is_grayscale_plte(chunk) else None
+    return None
+
+def copy_with_palette(src, dst, palette, tags=IMAGE_CHUNKS):
+    """Copy the tags chunks of an indexed PNG file with its PLTE chunk replaced, one chunk at a time."""
+    plte = plte_bytes(palette)
+    png.write_chunks(dst, ((tag, plte if tag == b"PLTE" else chunk)
+                           for tag, chunk in png.Reader(src).chunks() if tag in tags))
+
+def colorize_stream(filename, outputs, profile="default", bitdepth=None):
+    """
+    colorize_all() for PNG sprites too big to be held in memory.
+    The sprite is decoded twice one row at a time: once for its
+    color set, and once to index and encode its rows as they come.
+    The first output is written that way, the other ones are
+    copied from it one chunk at a time, so that peak memory only
+    depends on the width of the sprite. The archival profile needs
+    whole images and can't be streamed. Animated sprites are already
+    colorized one frame at a time by animation.py.
+    """
+    with open(filename, "rb") as file:
+        kind = animation_format(file)
+        if kind is not None:
+            import animation
+            return animation.colorize_all(file, kind, outputs, profile, bitdepth)
+    level = PROFILES[profile]
+    if level is None:
+        raise ValueError("the archival profile can't be streamed")
+    (first, colors), *others = outputs.items()
+    used = (0, 1, 2, 3)
+    with open(filename, "rb") as file:
+        depth = grayscale_bitdepth(file)
+        file.seek(0)
+        if depth is not None and bitdepth in (None, depth):
+            palette = GRAYSCALE
+            with atomic_open(first) as out:
+                copy_with_palette(file, out, output_palette(palette, colors))
+        else:
+            with stage("stream colors"):
+                sprite_colors = stream_color_set(stream_rgba8(file)[2])
+            palette = None if sprite_colors is None else sort_palette(sprite_colors)
+            if palette is None:
+                return False
+            if bitdepth is None:
+                bitdepth = 8
+            elif bitdepth == 1:
+                used = tuple(i for i, c in enumerate(palette) if c in sprite_colors)
+                if len(used) > 2:
+                    bitdepth = 2
+                    used = (0, 1, 2, 3)
+            lut = np.zeros(4, dtype=np.uint8)
+            lut[list(used)] = range(len(used))
+            lut = lut[index_lut(palette)]
+            file.seek(0)
+            width, height, rows = stream_rgba8(file)
+            scanlines = (pack_scanlines(lut[rgb5_keys(row)][None], bitdepth)[0] for row in rows)
+            colors = output_palette(palette, colors)
+            writer = png.Writer(width, height, palette=[colors[i] for i in used],
+                                bitdepth=bitdepth, compression=level)
+            with stage("stream encode"), atomic_open(first) as out:
+                writer.write_packed(out, scanlines)
+    for output, colors in others:
+        colors = output_palette(palette, colors)
+        with open(first, "rb") as src, atomic_open(output) as dst:
+            copy_with_palette(src, dst, [colors[i] for i in used])
+    return True
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Usage: python sheet.py [-c cell_size] [-e profile] [-o output] tool (mode) mapping.txt sheet.png
+
+Colorize every cell of a sprite sheet with its own palette of
+one of the colorizers (g, rb, y, gs97), in one pass over the
+sheet. The mapping file lists one palette name per cell, in
+reading order; - or a missing line keeps the cell as it is.
+Cells default to 56x56, as the Gen 1 and Gen 2 fronts.
+"""
+
+import argparse
+import sys
+
+import batch
+import profiling
+import sgbpal
+
+def cell_size(text):
+    width, _, height = text.lower().partition("x")
+    return int(width), int(height or width)
+
+def cell_palettes(tool, mode, names):
+    """RGB555 palettes of the tool for palette names, None for -."""
+    args = () if mode is None else (mode,)
+    return [None if name == "-" else next(iter(batch.tool_outputs(tool, args + (name,), "cell.png").values()))
+            for name in names]
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Colorize every cell of a sprite sheet with its own palette.")
+    parser.add_argument("-c", "--cell", type=cell_size, default=(56, 56), metavar="WxH", help="cell size (default: 56x56)")
+    parser.add_argument("-e", "--encode", choices=sgbpal.PROFILES, default="default", help="PNG encode profile")
+    parser.add_argument("-o", "--output", help="output sheet (default: in place)")
+    tools = parser.add_subparsers(dest="tool", required=True)
+    for name in ("g", "rb"):
+        tool = tools.add_parser(name)
+        tool.set_defaults(mode=None)
+        tool.add_argument("mapping")
+        tool.add_argument("sheet")
+    for name, modes in (("y", ("sgb", "gbc")), ("gs97", ("normal", "shiny"))):
+        tool = tools.add_parser(name)
+        tool.add_argument("mode", choices=modes)
+        tool.add_argument("mapping")
+        tool.add_argument("sheet")
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+    names = [line.lower() for line in batch.read_manifest(args.mapping)]
+    unknown = sorted(set(names) - set(batch.palette_names(args.tool)) - {"-"})
+    if unknown:
+        print(f"Incorrect palette names: {', '.join(unknown)}\nType python sgbpal_{args.tool}.py -help to see all palettes", file=sys.stderr)
+        sys.exit(1)
+    try:
+        bad = sgbpal.colorize_sheet(args.sheet, *args.cell, cell_palettes(args.tool, args.mode, names),
+                                    args.output, args.encode)
+    except ValueError as e:
+        print(f"{args.sheet}: {e}", file=sys.stderr)
+        sys.exit(1)
+    for n in bad:
+        print(f"{args.sheet}: cell {n} has too many colors!", file=sys.stderr)
+
+if __name__ == '__main__':
+    profiling.run(main)
@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Usage: python watch.py [-i interval] [-d debounce] [-j jobs] [-e profile] [-b bitdepth] [-q] [--once] source output tool (mode) (palette_name)
+
+Watch a directory of sprites and run one of the tools (as in
+batch.py) on the ones that change, writing their outputs to a
+separate directory with the same layout: the sources are never
+overwritten. The PNG, GIF and .2bpp files of the source tree are
+polled every interval, and a changed file is processed once its
+modification time and size have been stable for the debounce
+delay, so that a save written in several steps is read whole.
+
+A manifest in the output directory keeps the modification time,
+size and digest of every processed source: files whose contents
+didn't change are not processed again, across runs too. Outputs
+of deleted sources, and outputs no longer written for a source
+(when it now fails, or after the tool, its palettes or the options
+changed, which processes every file again) are removed.
+
+Every processed file is printed with its processing time and its
+latency, from its modification to its outputs being written; the
+percentiles of the latencies are printed on exit. With --once,
+the output directory is brought up to date and the script exits.
+"""
+
+import argparse
+import concurrent.futures
+import contextlib
+import hashlib
+import json
+import os
+import sys
+import time
+
+import batch
+import profiling
+import sgbpal
+
+MANIFEST = ".watch.json"
+VERSION = 1
+
+def file_digest(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def snapshot(directory, skip=None):
+    """Relative path -> (mtime_ns, size) of the sprites of a directory tree, but for the skip directory."""
+    files = {}
+    # relative path of a directory with a trailing separator
+    stack = [(directory, "")]
+    while stack:
+        path, prefix = stack.pop()
+        try:
+            entries = os.scandir(path)
+        except FileNotFoundError:
+            # deleted since it was listed, but the tree itself must exist
+            if path == directory:
+                raise
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.path != skip:
+                        stack.append((entry.path, prefix + entry.name + os.sep))
+                elif entry.name.lower().endswith(batch.EXTENSIONS):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    files[prefix + entry.name] = (stat.st_mtime_ns, stat.st_size)
+    return files
+
+def stat_key(filename):
+    """(mtime_ns, size) of a file, or None if it was deleted."""
+    try:
+        stat = os.stat(filename)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+def process(task):
+    """
+    Run a tool on a source file whose digest isn't the one of its
+    last run, and write its outputs. Return a report: file, digest,
+    outputs (relative to the output directory), error, processing
+    time and time the outputs were written.
+    """
+    source, output, rel, digest, tool, args, options = task
+    start = time.perf_counter()
+    report = {"file": rel, "digest": None, "outputs": [], "error": None, "work": None, "written": None}
+    filename = os.path.join(source, rel)
+    try:
+        with profiling.stage("read"), open(filename, "rb") as file:
+            data = file.read()
+        report["digest"] = file_digest(data)
+        if report["digest"] == digest:
+            return report
+        outputs, report["error"] = batch.process_data(tool, args, filename, data, options)
+        if outputs is not None:
+            for path, out in outputs.items():
+                out_rel = os.path.relpath(path, source)
+                target = os.path.join(output, out_rel)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with profiling.stage("write"):
+                    sgbpal.atomic_write(target, out)
+                report["outputs"].append(out_rel)
+    except Exception as e:
+        report["error"] = str(e) or type(e).__name__
+    report["work"] = time.perf_counter() - start
+    report["written"] = time.time()
+    return report
+
+class Watcher:
+    """
+    Incremental runs of a tool from a source tree to an output tree,
+    with a manifest of what was processed.
+    """
+    def __init__(self, source, output, tool, args, options={}, jobs=None, debounce=0.1):
+        self.source = os.path.abspath(source)
+        self.output = os.path.abspath(output)
+        if self.source == self.output:
+            raise ValueError("the output directory must not be the source directory")
+        self.tool, self.args, self.options = tool, tuple(args), options
+        self.jobs = jobs
+        self.debounce = debounce
+        self.executor = None
+        # relative path -> (stat key, monotonic time it was first seen)
+        self.pending = {}
+        self.latencies = []
+        os.makedirs(self.output, exist_ok=True)
+        self.manifest_file = os.path.join(self.output, MANIFEST)
+        # as read back from JSON
+        self.settings = [VERSION, tool, list(self.args), [list(item) for item in sorted(options.items())]]
+        self.files = {}
+        with contextlib.suppress(FileNotFoundError, ValueError):
+            with open(self.manifest_file, encoding="utf-8") as file:
+                manifest = json.load(file)
+            self.files = manifest["files"]
+            if manifest.get("settings") != self.settings:
+                # processed again, their former outputs are removed unless written again
+                for entry in self.files.values():
+                    entry["stat"] = entry["digest"] = None
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def save(self):
+        data = json.dumps({"settings": self.settings, "files": self.files}, separators=(",", ":"))
+        sgbpal.atomic_write(self.manifest_file, data.encode())
+
+    def changes(self, files):
+        """Changed and deleted sources of a snapshot, against the manifest."""
+        changed = [rel for rel, key in files.items()
+                   if rel not in self.files or tuple(self.files[rel]["stat"] or ()) != key]
+        deleted = [rel for rel in self.files if rel not in files]
+        return changed, deleted
+
+    def remove_outputs(self, outputs):
+        for out_rel in outputs:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(os.path.join(self.output, out_rel))
+
+    def remove(self, deleted):
+        """Remove the outputs of deleted sources."""
+        reports = []
+        for rel in deleted:
+            self.remove_outputs(self.files.pop(rel)["outputs"])
+            reports.append({"file": rel, "deleted": True})
+        return reports
+
+    def sync(self, stats, track=True):
+        """
+        Process the sources of relative path -> stat key, in this
+        process for a single file, by a pool of processes otherwise,
+        and update the manifest. Return their reports, with their
+        latencies if track, also kept in latencies.
+        """
+        tasks = [(self.source, self.output, rel, self.files.get(rel, {}).get("digest"),
+                  self.tool, self.args, self.options) for rel in stats]
+        if len(tasks) == 1 or self.jobs == 1:
+            reports = map(process, tasks)
+        else:
+            if self.executor is None:
+                self.executor = concurrent.futures.ProcessPoolExecutor(self.jobs)
+            reports = self.executor.map(process, tasks, chunksize=16)
+        reports = list(reports)
+        for report in reports:
+            rel, key = report["file"], stats[report["file"]]
+            entry = self.files.get(rel)
+            if entry is not None and report["written"] is None:
+                # same contents
+                entry["stat"] = key
+                continue
+            if entry is not None:
+                # no longer written, or the source now fails
+                self.remove_outputs(set(entry["outputs"]) - set(report["outputs"]))
+            # files with errors are tried again once they change
+            self.files[rel] = {"stat": key, "digest": report["digest"], "outputs": report["outputs"]}
+            if track and report["error"] is None:
+                # from the modification of the source to its outputs
+                report["latency"] = max(0.0, report["written"] - key[0] / 1e9)
+                self.latencies.append(report["latency"])
+        self.save()
+        return reports
+
+    def update(self):
+        """
+        Process every changed source at once, without debouncing nor
+        tracking their latencies. Return the reports.
+        """
+        changed, deleted = self.changes(snapshot(self.source, self.output))
+        reports = self.remove(deleted)
+        stats = {rel: stat_key(os.path.join(self.source, rel)) for rel in changed}
+        stats = {rel: key for rel, key in stats.items() if key is not None}
+        if stats:
+            reports += self.sync(stats, track=False)
+        elif deleted:
+            self.save()
+        return reports
+
+    def poll(self, full=True):
+        """
+        Look for changed sources, through a snapshot of the source
+        tree if full, or only among the pending ones, and process
+        the ones that have been stable for the debounce delay.
+        Return the reports and the monotonic time of the next check
+        of a pending source, or None.
+        """
+        now = time.monotonic()
+        reports = []
+        if full:
+            files = snapshot(self.source, self.output)
+            changed, deleted = self.changes(files)
+            reports += self.remove(deleted)
+            if deleted:
+                self.save()
+        else:
+            files = {rel: stat_key(os.path.join(self.source, rel)) for rel in self.pending}
+            changed = [rel for rel, key in files.items() if key is not None]
+        ready = {}
+        for rel in changed:
+            key = files[rel]
+            seen = self.pending.get(rel)
+            if seen is None or seen[0] != key:
+                self.pending[rel] = (key, now)
+            elif now - seen[1] >= self.debounce:
+                ready[rel] = key
+        for rel in list(self.pending):
+            if rel in ready or rel not in files or files[rel] is None:
+                del self.pending[rel]
+        if ready:
+            reports += self.sync(ready)
+        next_check = min((since + self.debounce for _, since in self.pending.values()), default=None)
+        return reports, next_check
+
+    def run(self, interval=0.25, report=print, stop=None):
+        """
+        Poll the source tree every interval seconds, calling report
+        with every report, until the stop threading.Event is set.
+        """
+        next_scan = time.monotonic()
+        next_check = None
+        while stop is None or not stop.is_set():
+            now = time.monotonic()
+            full = now >= next_scan
+            if full:
+                next_scan = now + interval
+            reports, next_check = self.poll(full)
+            for r in reports:
+                report(r)
+            wake = next_scan if next_check is None else min(next_scan, next_check)
+            time.sleep(max(0.0, wake - time.monotonic()))
+
+def format_report(report):
+    if report.get("deleted"):
+        return f"{report['file']}: deleted, outputs removed"
+    if report["error"]:
+        return f"{report['file']} {report['error']}"
+    if report["written"] is None:
+        return f"{report['file']}: unchanged"
+    text = f"{report['file']}: {len(report['outputs'])} outputs in {report['work'] * 1000:.0f}ms"
+    if "latency" in report:
+        text += f", {report['latency'] * 1000:.0f}ms after the save"
+    return text
+
+def format_latencies(latencies):
+    latencies = sorted(latencies)
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[min(len(latencies) - 1, len(latencies) * 99 // 100)] * 1000
+    return f"{len(latencies)} files processed, latency p50 {p50:.0f}ms, p99 {p99:.0f}ms, max {latencies[-1] * 1000:.0f}ms"
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run a tool on the sprites of a directory as they change.")
+    parser.add_argument("-i", "--interval", type=float, default=0.25, help="seconds between polls of the source tree")
+    parser.add_argument("-d", "--debounce", type=float, default=0.1,
+                        help="seconds a changed file must be stable before it is processed")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="worker processes for many changes (default: CPU count)")
+    parser.add_argument("-e", "--encode", choices=sgbpal.PROFILES, default="default",
+                        help="PNG encode profile of the colorizers")
+    parser.add_argument("-b", "--bitdepth", type=int, choices=(8, 2, 1),
+                        help="bit depth of the colorizers' outputs (1 falls back to 2 beyond two colors)")
+    parser.add_argument("-w", "--width", type=int, help="width in pixels of .2bpp sprites (default: square)")
+    parser.add_argument("-Z", "--columns", action="store_true", help=".2bpp tiles in column-major order")
+    parser.add_argument("-q", "--quiet", action="store_true", help="only print errors and the latencies on exit")
+    parser.add_argument("--once", action="store_true", help="bring the output directory up to date and exit")
+    parser.add_argument("source")
+    parser.add_argument("output")
+    tools = parser.add_subparsers(dest="tool", required=True)
+    for name in ("g", "rb"):
+        tool = tools.add_parser(name)
+        tool.add_argument("palette_name")
+    for name, modes in (("y", ("sgb", "gbc", "all")), ("gs97", ("normal", "shiny", "all"))):
+        tool = tools.add_parser(name)
+        tool.add_argument("mode", choices=modes)
+        tool.add_argument("palette_name")
+    for name in ("g2rb", "rb2g"):
+        tools.add_parser(name)
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+    if args.tool not in ("g2rb", "rb2g"):
+        if args.palette_name.lower() not in batch.palette_names(args.tool) and args.palette_name.lower() not in ("all", "auto"):
+            print(f"Incorrect palette name!\nType python sgbpal_{args.tool}.py -help to see all palettes", file=sys.stderr)
+            sys.exit(1)
+    if not os.path.isdir(args.source):
+        print(f"{args.source} is not a directory!", file=sys.stderr)
+        sys.exit(1)
+    options = {"profile": args.encode, "bitdepth": args.bitdepth, "width": args.width, "columns": args.columns}
+    if profiling.ENABLED:
+        args.jobs = 1
+    # imported before the first change
+    batch.tool_module(args.tool)
+
+    def report(r):
+        if r.get("error"):
+            print(format_report(r), file=sys.stderr)
+        elif not args.quiet:
+            print(format_report(r), flush=True)
+
+    try:
+        watcher = Watcher(args.source, args.output, args.tool, batch.tool_args(args), options, args.jobs, args.debounce)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+    with watcher:
+        start = time.perf_counter()
+        for r in watcher.update():
+            report(r)
+        print(f"{args.output} up to date in {time.perf_counter() - start:.2f}s", file=sys.stderr)
+        if not args.once:
+            print(f"Watching {args.source}, Ctrl+C to stop", file=sys.stderr)
+            with contextlib.suppress(KeyboardInterrupt):
+                watcher.run(args.interval, report)
+        if watcher.latencies:
+            print(format_latencies(watcher.latencies), file=sys.stderr)
+
+if __name__ == '__main__':
+    profiling.run(main)
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Shared white color swap of g2rb.py and rb2g.py.
+
+Images with at most 5 colors are indexed with NumPy masks
+and only get their palette entries rewritten. Other images
+are swapped in place in a NumPy buffer, then reduced to an
+adaptive 5-color palette as before. Pillow is only imported
+by the functions that need it, pipeline.py swaps without it.
+"""
+
+import io
+
+import numpy as np
+
+from colors import GREEN_WHITE, RB_WHITE, atomic_open
+from profiling import stage
+
+# zlib level of each encode profile of sgbpal.py, Pillow's own by default
+COMPRESS_LEVELS = {"fast": 1, "default": 6, "archival": 9}
+
+def swap_palette(img, old, new):
+    """
+    Rewrite the palette entries of an indexed image equal to old.
+    Return False if the image can't be swapped that way, i.e. if it
+    has transparency or more colors than the indexed output keeps.
+    """
+    if "transparency" in img.info or img.getcolors(5) is None:
+        return False
+    palette = img.getpalette()
+    for i in range(0, len(palette) - 2, 3):
+        if tuple(palette[i:i+3]) == old:
+            palette[i:i+3] = new
+    img.putpalette(palette)
+    return True
+
+def swap_pixels(pixels, old, new):
+    """Replace the old color by the new one in a (height, width, 3) array."""
+    mask = pixels[..., 0] == old[0]
+    mask &= pixels[..., 1] == old[1]
+    mask &= pixels[..., 2] == old[2]
+    pixels[mask] = new
+
+def index_colors(pixels, colors):
+    """
+    Index a (height, width) array of RGBX pixels viewed as
+    uint32 values, made of the given RGBX colors only.
+    """
+    keys = np.array(colors, dtype=np.uint8).view(np.uint32)[:, 0]
+    indices = np.zeros(pixels.shape, dtype=np.uint8)
+    for i, k in enumerate(keys[1:], 1):
+        np.putmask(indices, pixels == k, i)
+    return indices
+
+def swapped(img, old, new):
+    """The image to save once the old white of img is swapped for the new one."""
+    from PIL import Image
+    if img.mode == "P" and swap_palette(img, old, new):
+        return img
+    img = img.convert("RGBX")
+    colors = img.getcolors(5)
+    if colors is not None:
+        colors = sorted(c for n, c in colors)
+        pixels = np.asarray(img).view(np.uint32)[..., 0]
+        img.close()
+        img_index = Image.fromarray(index_colors(pixels, colors), "P")
+        del pixels
+        img_index.putpalette([v for c in colors for v in (new if c[:3] == old else c[:3])])
+        return img_index
+    pixels = np.array(img.convert("RGB"))
+    img.close()
+    swap_pixels(pixels, old, new)
+    img = Image.fromarray(pixels, "RGB")
+    del pixels
+    return img.convert("P", palette=Image.ADAPTIVE, colors=5)
+
+def swap_white(filename, old, new, profile="default"):
+    from PIL import Image
+    with stage("decode"):
+        img = Image.open(filename)
+        img.load()
+    with stage("swap"):
+        img = swapped(img, old, new)
+    with stage("encode"):
+        with atomic_open(filename) as file:
+            img.save(file, "PNG", compress_level=COMPRESS_LEVELS[profile])
+    return True
+
+def swap_white_data(data, old, new, profile="default"):
+    """PNG bytes of a sprite given as PNG bytes with its white swapped."""
+    from PIL import Image
+    out = io.BytesIO()
+    swapped(Image.open(io.BytesIO(data)), old, new).save(out, "PNG", compress_level=COMPRESS_LEVELS[profile])
+    return out.getvalue()